@@ -0,0 +1,65 @@
+'''
+Время проверки корзины (BasketSerializer.is_valid) в зависимости
+от размера каталога: проверяются только товары из запроса, поэтому
+время не должно расти вместе с каталогом. Для сравнения - время
+чтения остатков всего каталога, как делала прежняя проверка.
+Данные создаются в транзакции, которая откатывается, база должна
+быть создана (migrate).
+
+Запуск из корня проекта:
+    python -m benchmarks.basket_validation --rows 1000 10000 100000
+'''
+import argparse
+from time import perf_counter
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from benchmarks.catalog_serializers import Rollback, create_catalog
+from shop.models import ProductInfo
+from shop.serializers import BasketSerializer
+
+
+def best_of(repeat, function):
+    durations = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        durations.append(perf_counter() - start)
+    return min(durations)
+
+
+def validate(items):
+    serializer = BasketSerializer(data={'items': items, 'status': 'basket'})
+    assert serializer.is_valid(), serializer.errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--items', type=int, default=10, help='позиций в корзине')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{"товаров":>10}{"проверка, мс":>14}{"запросов":>10}{"весь каталог, мс":>18}')
+    for rows in args.rows:
+        try:
+            with transaction.atomic():
+                shop, _ = create_catalog(rows)
+                product_ids = list(ProductInfo.objects.filter(
+                    shop=shop, quantity__gt=0).values_list('id', flat=True)[:args.items])
+                items = [{'product': product_id, 'quantity': 1} for product_id in product_ids]
+
+                with CaptureQueriesContext(connection) as queries:
+                    validate(items)
+                duration = best_of(args.repeat, lambda: validate(items))
+                full = best_of(args.repeat, lambda: dict(
+                    ProductInfo.objects.filter(shop__is_open=True).values_list('id', 'quantity')))
+                print(f'{rows:>10}{duration * 1000:>14.2f}{len(queries):>10}{full * 1000:>18.2f}')
+                raise Rollback
+        except Rollback:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+'''
+Сравнение сериализаторов DRF и сериализаторов по строкам .values()
+(shop.fast_serializers) на ответах каталога: магазин со всеми
+предложениями (ShopItemsViewSerializer) и список продуктов
+(ProductsViewSerializer). Данные создаются в транзакции, которая
+откатывается, база должна быть создана (migrate).
+
+Запуск из корня проекта:
+    python -m benchmarks.catalog_serializers --rows 1000 10000 100000
+'''
+import argparse
+import os
+from time import perf_counter
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'orders.settings')
+django.setup()
+
+from django.db import transaction  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from benchmarks.price_list_formats import PARAMETERS, generate  # noqa: E402
+from shop.fast_serializers import ProductsViewFastSerializer, ShopItemsViewFastSerializer  # noqa: E402
+from shop.models import (  # noqa: E402
+    Shop, Category, Product, ProductCard, ProductInfo, Parameter, ProductParameter
+)
+from shop.serializers import ProductsViewSerializer, ShopItemsViewSerializer  # noqa: E402
+from users.models import User  # noqa: E402
+
+
+class Rollback(Exception):
+    pass
+
+
+def create_catalog(rows):
+    '''Магазин, категории, продукты с карточками, предложения и параметры'''
+
+    price_list = generate(rows)
+    user = User.objects.create(email=f'benchmark{rows}@example.com', username=f'benchmark{rows}', role='shop')
+    shop = Shop.objects.create(name=f'Бенчмарк {rows}', user=user)
+    categories = {
+        category['id']: Category.objects.create(name=category['name']) for category in price_list['categories']
+    }
+    parameters = {name: Parameter.objects.get_or_create(name=name)[0] for name in PARAMETERS}
+    products = Product.objects.bulk_create([
+        Product(name=item['name'], category=categories[item['category']], rrc=item['price_rrc'])
+        for item in price_list['goods']
+    ], batch_size=1000)
+    product_infos = ProductInfo.objects.bulk_create([
+        ProductInfo(shop=shop, product=product, model=item['model'], article=item['id'], price=item['price'],
+                    quantity=item['quantity'])
+        for product, item in zip(products, price_list['goods'])
+    ], batch_size=1000)
+    ProductParameter.objects.bulk_create([
+        ProductParameter(product=product_info, parameter=parameters[name], value=value)
+        for product_info, item in zip(product_infos, price_list['goods'])
+        for name, value in item['parameters'].items()
+    ], batch_size=1000)
+    ProductCard.objects.bulk_create([
+        ProductCard(product=product, category_name=categories[item['category']].name, min_price=item['price'],
+                    max_price=item['price'], quantity=item['quantity'], shop_ids=[shop.id], product_infos=[])
+        for product, item in zip(products, price_list['goods'])
+    ], batch_size=1000)
+    return shop, [product.id for product in products]
+
+
+def measure(serializer_class, queryset, many, context):
+    start = perf_counter()
+    queryset = serializer_class.setup_queryset(queryset)
+    data = serializer_class(queryset if many else queryset.get(), many=many, context=context).data
+    duration = perf_counter() - start
+    return JSONRenderer().render(data), duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    context = {'request': Request(APIRequestFactory().get('/api/v1/products/'))}
+    print(f'{"ответ":<16}{"строк":>8}{"DRF, с":>10}{".values(), с":>14}{"ускорение":>11}')
+    for rows in args.rows:
+        try:
+            with transaction.atomic():
+                shop, product_ids = create_catalog(rows)
+                cases = (
+                    ('магазин', ShopItemsViewSerializer, ShopItemsViewFastSerializer,
+                     Shop.objects.filter(id=shop.id), False),
+                    ('продукты', ProductsViewSerializer, ProductsViewFastSerializer,
+                     Product.objects.filter(id__in=product_ids), True),
+                )
+                for name, serializer_class, fast_serializer_class, queryset, many in cases:
+                    expected, duration = measure(serializer_class, queryset, many, context)
+                    content, fast_duration = measure(fast_serializer_class, queryset, many, context)
+                    assert content == expected, f'{name}: ответы отличаются'
+                    print(f'{name:<16}{rows:>8}{duration:>10.2f}{fast_duration:>14.2f}'
+                          f'{duration / fast_duration:>10.1f}x')
+                raise Rollback
+        except Rollback:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Сравнение скорости и размера JSON ответа каталога: JSONRenderer DRF
+(стандартный json) и FastJSONRenderer с доступными библиотеками.
+Ответ строится как у ShopItemsViewSerializer - магазин со всеми
+предложениями и параметрами.
+
+Запуск из корня проекта:
+    python -m benchmarks.json_renderers --items 20000
+'''
+import argparse
+from decimal import Decimal
+from time import perf_counter
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from benchmarks.price_list_formats import generate  # noqa: E402
+from shop import renderers  # noqa: E402
+
+
+def shop_response(items):
+    price_list = generate(items)
+    return {
+        'name': price_list['shop']['name'],
+        'product_infos': [
+            {
+                'id': number, 'product': item['name'], 'model': item['model'], 'shop': price_list['shop']['name'],
+                'article': item['id'], 'price': f'{item["price"]:.2f}', 'quantity': item['quantity'],
+                'parameters': [{'parameter': name, 'value': str(value)} for name, value in item['parameters'].items()]
+            } for number, item in enumerate(price_list['goods'], 1)
+        ],
+        'min_price': Decimal('1000.00'),
+    }
+
+
+def measure(render, data, repeat):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        content = render(data)
+        duration = perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return content, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    data = shop_response(args.items)
+    candidates = {'json': JSONRenderer().render}
+    if renderers.ujson is not None:
+        candidates['ujson'] = lambda data: renderers.dumps_ujson(data, ensure_ascii=False)
+    if renderers.orjson is not None:
+        candidates['orjson'] = lambda data: renderers.dumps_orjson(data, ensure_ascii=False)
+
+    expected = None
+    print(f'{"библиотека":<12}{"размер, МБ":>12}{"время, мс":>12}{"МБ/с":>10}')
+    for name, render in candidates.items():
+        content, duration = measure(render, data, args.repeat)
+        expected = expected or content
+        assert content == expected, f'{name}: ответ отличается от JSONRenderer'
+        size = len(content) / 2 ** 20
+        print(f'{name:<12}{size:>12.1f}{duration * 1000:>12.1f}{size / duration:>10.0f}')
+    print(f'FastJSONRenderer использует: {renderers.backend}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+'''
+Сравнение скорости потокового чтения прайс-листа в форматах yaml, csv и jsonl.
+
+Запуск из корня проекта:
+    python -m benchmarks.price_list_formats --items 100000
+'''
+import argparse
+import csv
+import json
+import os
+import tempfile
+from time import perf_counter
+
+import yaml
+
+from shop.price_lists import read_price_list
+
+
+PARAMETERS = ('Диагональ (дюйм)', 'Разрешение (пикс)', 'Встроенная память (Гб)', 'Цвет')
+COLORS = ('черный', 'белый', 'красный', 'золотистый', 'серебристый')
+
+
+def generate(items):
+    categories = [{'id': id_, 'name': f'Категория {id_}'} for id_ in range(1, 51)]
+    goods = [
+        {
+            'id': 1000000 + number, 'category': number % 50 + 1, 'model': f'vendor/model-{number}',
+            'name': f'Товар {number}', 'price': 1000 + number % 90000, 'price_rrc': 1100 + number % 90000,
+            'quantity': number % 30,
+            'parameters': {
+                PARAMETERS[0]: round(4 + number % 30 / 10, 1), PARAMETERS[1]: '1920x1080',
+                PARAMETERS[2]: 2 ** (number % 8 + 3), PARAMETERS[3]: COLORS[number % len(COLORS)]
+            }
+        } for number in range(items)
+    ]
+    return {'shop': {'name': 'Бенчмарк'}, 'categories': categories, 'goods': goods}
+
+
+def write_yaml(price_list, path):
+    with open(path, 'w', encoding='utf-8') as stream:
+        dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+        yaml.dump(price_list, stream, Dumper=dumper, allow_unicode=True, sort_keys=False)
+
+
+def write_jsonl(price_list, path):
+    with open(path, 'w', encoding='utf-8') as stream:
+        stream.write(json.dumps({'shop': price_list['shop']}, ensure_ascii=False) + '\n')
+        stream.write(json.dumps({'categories': price_list['categories']}, ensure_ascii=False) + '\n')
+        for item in price_list['goods']:
+            stream.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+def write_csv(price_list, path):
+    names = {category['id']: category['name'] for category in price_list['categories']}
+    with open(path, 'w', encoding='utf-8', newline='') as stream:
+        writer = csv.writer(stream)
+        writer.writerow(['shop', 'category', 'category_name', 'id', 'model', 'name', 'price', 'price_rrc',
+                         'quantity', *PARAMETERS])
+        for item in price_list['goods']:
+            writer.writerow([
+                price_list['shop']['name'], item['category'], names[item['category']], item['id'], item['model'],
+                item['name'], item['price'], item['price_rrc'], item['quantity'],
+                *[item['parameters'][name] for name in PARAMETERS]
+            ])
+
+
+WRITERS = {'yaml': write_yaml, 'csv': write_csv, 'jsonl': write_jsonl}
+
+
+def measure(format_, path, batch_size):
+    start, goods = perf_counter(), 0
+    with open(path, 'rb') as stream:
+        for section, value in read_price_list(format_, stream, batch_size):
+            if section == 'goods':
+                goods += len(value)
+    return goods, perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    price_list = generate(args.items)
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'{"формат":<8}{"размер, МБ":>12}{"время, с":>12}{"товаров/с":>14}')
+        for format_, write in WRITERS.items():
+            path = os.path.join(directory, f'price_list.{format_}')
+            write(price_list, path)
+            goods, duration = measure(format_, path, args.batch_size)
+            assert goods == args.items
+            size = os.path.getsize(path) / 2 ** 20
+            print(f'{format_:<8}{size:>12.1f}{duration:>12.2f}{goods / duration:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
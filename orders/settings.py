@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'users.apps.UsersConfig',
     'shop.apps.ShopConfig',
     'rest_framework',
@@ -133,6 +134,9 @@ STATIC_URL = '/static/'
 STATIC_ROOT = '/static/'
 # STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Файлы прайс-листов для импорта, общие для web и celery
+MEDIA_ROOT = config('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -155,6 +159,15 @@ REST_FRAMEWORK = {
         'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
         'drf_social_oauth2.authentication.SocialAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'shop.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'shop.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 40,
     'DEFAULT_THROTTLE_CLASSES': [
@@ -172,10 +185,40 @@ REST_FRAMEWORK = {
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
 }
 
+# Кеш: redis://host:port/db, по умолчанию - redis брокера celery. Версии каталога и справочников
+# в кеше общие для web и celery, кеш в памяти процесса (locmem://) - только для тестов и DEBUG
+CACHE_URL = config('CACHE_URL', default=config('CELERY_BROKER', default='redis://127.0.0.1:6379'))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+    } if CACHE_URL == 'locmem://' else {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL
+    }
+}
+# Время хранения ответов каталога для анонимных пользователей, с
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=600, cast=int)
+# Ответы каталога собираются из строк .values() без сериализаторов DRF (shop.fast_serializers)
+CATALOG_FAST_SERIALIZERS = config('CATALOG_FAST_SERIALIZERS', default=True, cast=bool)
+
 CELERY_BROKER_URL = config('CELERY_BROKER', default='redis://127.0.0.1:6379')
 CELERY_RESULT_BACKEND = config('CELERY_BACKEND', default='redis://127.0.0.1:6379')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-reservations': {
+        'task': 'shop.tasks.release_expired_reservations_task',
+        'schedule': config('ORDER_RESERVATION_SWEEP_INTERVAL', default=300, cast=int),
+    },
+}
+
+# Через сколько секунд без изменений новый заказ отменяется и резерв товаров снимается
+ORDER_RESERVATION_TTL = config('ORDER_RESERVATION_TTL', default=24 * 60 * 60, cast=int)
+ORDER_RESERVATION_BATCH_SIZE = config('ORDER_RESERVATION_BATCH_SIZE', default=500, cast=int)
+
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=1000, cast=int)
+IMPORT_TIMEOUT = config('IMPORT_TIMEOUT', default=30, cast=int)
+# Части большого прайс-листа обрабатываются параллельно несколькими воркерами
+IMPORT_PARALLEL = config('IMPORT_PARALLEL', default=True, cast=bool)
 
 SOCIAL_AUTH_VK_OAUTH2_KEY = config('VK_APP_ID')
 SOCIAL_AUTH_VK_OAUTH2_SECRET = config('VK_APP_SECRET')
@@ -1,10 +1,13 @@
 
 from django.contrib import admin, messages
-from django.db import IntegrityError, transaction
 from django.http import HttpResponseRedirect
 
-from shop.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem
+from shop.models import (
+    Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, ImportJob
+)
+from shop.stock import StockReservationError, release_stock, reserve_stock
 from shop.tasks import change_status_email_task
+from shop.transitions import change_status
 
 
 @admin.register(Shop)
@@ -39,37 +42,75 @@ class ProductParameter(admin.ModelAdmin):
     list_display = ['id', 'product', 'value']
 
 
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'url', 'status', 'rows_processed', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['user', 'url', 'file', 'status', 'rows_processed', 'timings', 'counts', 'error',
+                       'created_at', 'started_at', 'finished_at']
+
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ['product', 'quantity']
+    readonly_fields = ['product', 'quantity', 'price']
     radio_fields = {'product': admin.VERTICAL}
 
 
+def status_action(from_status, to_status):
+    '''Действие списка заказов: перевод выбранных заказов в статусе from_status в to_status'''
+
+    names = dict(Order.STATE_CHOICES)
+
+    @admin.action(description=f'Сменить статус: {names[from_status]} → {names[to_status]}', permissions=['change'])
+    def action(modeladmin, request, queryset):
+        changed = change_status(queryset, from_status, to_status)
+        modeladmin.message_user(request, f'Статус "{names[to_status]}" у {len(changed)} заказов')
+        skipped = queryset.count() - len(changed)
+        if skipped:
+            # подтверждаются только заказы с резервом товаров
+            modeladmin.message_user(request, f'Пропущено заказов: {skipped}', level=messages.WARNING)
+
+    action.__name__ = f'{from_status}_to_{to_status}'
+    return action
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'contacts', 'created_at', 'status']
     list_filter = ['created_at', 'status', 'user']
     list_editable = ['status']
-    fields = (('user', 'contacts'), ('created_at', 'updated_at'), 'status')
-    readonly_fields = ('created_at', 'updated_at')
+    fields = (('user', 'contacts'), ('created_at', 'updated_at'), 'status', ('total_price', 'stock_reserved'))
+    readonly_fields = ('created_at', 'updated_at', 'total_price', 'stock_reserved')
     inlines = [OrderItemInline]
+    actions = [status_action(from_status, to_status) for from_status, to_status in Order.TRANSITIONS]
 
     def save_model(self, request, obj, form, change):
         '''
-        Перед подтверждением заказа проверяются товары в наличии.
-        При успешной проверке товаров отправляется письмо пользователю
-        и администратору с измененным статусом заказа. Количество товара
-        в магазине уменьшается на количество товара в заказе.
+        Товары заказа резервируются при подтверждении покупателем,
+        подтверждение администратором использует этот резерв. Для заказов
+        без резерва товары резервируются здесь, при нехватке статус
+        не меняется. При отмене заказа резерв возвращается на склад.
+        После смены статуса отправляется письмо пользователю
+        и администратору с измененным статусом заказа.
         '''
-        if 'status' in form.changed_data and obj.status == 'confirmed':
-            with transaction.atomic():
-                for item in obj.ordered_items.all():
-                    try:
-                        item.product.quantity -= item.quantity
-                        item.product.save()
-                    except IntegrityError:
-                        self.message_user(request, 'недостаточно товаров', level=messages.ERROR)
-                        return HttpResponseRedirect('')
+        if 'status' in form.changed_data and obj.status == 'confirmed' and not obj.stock_reserved:
+            try:
+                reserve_stock(obj)
+            except StockReservationError as error:
+                self.message_user(request, f'недостаточно товаров: {error}', level=messages.ERROR)
+                return HttpResponseRedirect('')
+        if 'status' in form.changed_data and obj.status == 'canceled' and obj.stock_reserved:
+            release_stock([obj.id])
+            obj.stock_reserved = False
         change_status_email_task.delay(obj.user.id, obj.id, obj.get_status_display())
         return super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        '''После изменения позиций пересчитывается сумма заказа'''
+
+        super().save_related(request, form, formsets, change)
+        if form.instance.status == 'basket':
+            form.instance.update_total()
+        else:
+            form.instance.freeze_prices()
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        import shop.checks  # noqa
+        import shop.signals  # noqa
+        from shop.cards import install_product_cards
+        from shop.search import install_search_index
+        from shop.totals import install_order_totals
+
+        post_migrate.connect(install_search_index, sender=self)
+        post_migrate.connect(install_product_cards, sender=self)
+        post_migrate.connect(install_order_totals, sender=self)
@@ -0,0 +1,107 @@
+from hashlib import md5
+from time import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+VERSION_PREFIX = 'catalog:version:'
+RESPONSE_PREFIX = 'catalog:response:'
+COUNTERS = ('hits', 'misses')
+
+
+def shared():
+    '''Кеш общий для процессов web и celery: версии, измененные импортом в celery, видны web'''
+
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def versions(scopes):
+    '''
+    Текущие версии областей каталога ("catalog", "shop:1", "product:5"...).
+    Версия - время изменения и случайный токен, а не счетчик: если ключ
+    версии вытеснен из кеша, создается новая версия и старые ответы
+    больше не читаются.
+    '''
+
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, new_version(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def new_version():
+    return f'{int(time())}.{uuid4().hex}'
+
+
+def bump(*scopes):
+    '''Новые версии областей каталога, закешированные ответы по ним перестают читаться'''
+
+    if scopes:
+        cache.set_many({VERSION_PREFIX + scope: new_version() for scope in scopes}, timeout=None)
+
+
+def bump_on_commit(*scopes):
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def bump_shop(shop_id, category_ids=(), product_ids=()):
+    '''Изменение магазина: списки каталога, сам магазин, его категории и продукты'''
+
+    bump(
+        'catalog', f'shop:{shop_id}',
+        *(f'category:{id_}' for id_ in category_ids),
+        *(f'product:{id_}' for id_ in product_ids)
+    )
+
+
+def validators(request, scopes, *extra):
+    '''
+    Валидаторы ответа (ETag, Last-Modified) по версиям областей каталога
+    и дополнительным значениям, без сериализации ответа
+    '''
+
+    tokens = versions(scopes)
+    etag = md5('|'.join([request.META.get('HTTP_ACCEPT', ''), *tokens, *map(str, extra)]).encode())
+    return f'"{etag.hexdigest()}"', max(int(token.split('.')[0]) for token in tokens)
+
+
+def response_key(request, scopes):
+    '''Ключ ответа: адрес с параметрами запроса, Accept и версии областей'''
+
+    source = '|'.join([
+        request.build_absolute_uri(), request.META.get('HTTP_ACCEPT', ''), *versions(scopes)
+    ])
+    return RESPONSE_PREFIX + md5(source.encode()).hexdigest()
+
+
+def get_response(key):
+    return cache.get(key)
+
+
+def set_response(key, data):
+    cache.set(key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+
+def count(name):
+    key = f'catalog:{name}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # ключ вытеснен между add и incr
+        cache.set(key, 1, timeout=None)
+
+
+def stats():
+    '''Счетчики попаданий и промахов кеша ответов каталога'''
+
+    found = cache.get_many([f'catalog:{name}' for name in COUNTERS])
+    return {name: found.get(f'catalog:{name}', 0) for name in COUNTERS}
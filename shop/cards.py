@@ -0,0 +1,55 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max, Min, Sum
+
+from shop.models import Product, ProductCard, ProductInfo
+from shop.serializers import ProductInfoSerializer
+
+
+card_fields = ('category_name', 'min_price', 'max_price', 'quantity', 'shop_ids', 'product_infos')
+
+
+def update_cards(product_ids, batch_size=1000):
+    '''
+    Пересборка карточек продуктов: название категории, минимальная
+    и максимальная цена и остаток в открытых магазинах, магазины
+    с предложениями и готовые к выдаче предложения с параметрами.
+    Карточки вставляются или обновляются одним запросом на пачку.
+    '''
+
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        ids = product_ids[start:start + batch_size]
+        cards = {
+            id_: ProductCard(product_id=id_, category_name=category_name, shop_ids=[], product_infos=[])
+            for id_, category_name in Product.objects.filter(id__in=ids).values_list('id', 'category__name')
+        }
+
+        for product_id, min_price, max_price, quantity in ProductInfo.objects.filter(
+            product_id__in=cards, shop__is_open=True
+        ).values_list('product_id').annotate(Min('price'), Max('price'), Sum('quantity')).order_by():
+            card = cards[product_id]
+            card.min_price, card.max_price, card.quantity = min_price, max_price, quantity
+
+        product_infos = ProductInfoSerializer.setup_queryset(
+            ProductInfo.objects.filter(product_id__in=cards)
+        ).order_by('id')
+        shop_names = {}
+        for product_info in product_infos:
+            shop_names[product_info.shop_id] = product_info.shop.name
+            card = cards[product_info.product_id]
+            card.product_infos.append(ProductInfoSerializer(product_info).data)
+            if product_info.shop_id not in card.shop_ids:
+                card.shop_ids.append(product_info.shop_id)
+        for card in cards.values():
+            # порядок магазинов как у Product.shops: по названию
+            card.shop_ids.sort(key=lambda shop_id: shop_names[shop_id])
+
+        ProductCard.objects.bulk_create(
+            cards.values(), update_conflicts=True, unique_fields=['product_id'], update_fields=card_fields
+        )
+
+
+def install_product_cards(using=DEFAULT_DB_ALIAS, **kwargs):
+    '''Карточки для продуктов, созданных до появления ProductCard, вызывается после migrate'''
+
+    update_cards(Product.objects.using(using).filter(card__isnull=True).values_list('id', flat=True))
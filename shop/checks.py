@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from shop.cache import shared
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    '''Версии каталога и справочников меняются в celery и читаются в web: кеш должен быть общим'''
+
+    if shared():
+        return []
+    message = 'Кеш по умолчанию хранится в памяти процесса, изменения из celery не видны процессам web'
+    hint = 'Укажите CACHE_URL=redis://host:port/db'
+    if settings.DEBUG:
+        return [Warning(message, hint=hint, id='shop.W001')]
+    return [Error(message, hint=hint, id='shop.E001')]
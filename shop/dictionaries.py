@@ -0,0 +1,99 @@
+from threading import Lock
+from time import monotonic
+
+from django.db import transaction
+
+from shop.cache import bump_on_commit, versions
+from shop.models import Category, Parameter
+
+
+class ReferenceDictionary:
+    '''
+    Кеш небольшого справочника (name <-> id) в памяти процесса.
+    Справочник загружается целиком при первом обращении, при промахе
+    недостающие строки дочитываются из базы. Прочитанные внутри
+    транзакции строки попадают в кеш только после ее фиксации.
+    Сбрасывается сигналами post_save/post_delete модели (invalidate): версия
+    справочника в общем кеше Django меняется после фиксации транзакции,
+    и остальные процессы (gunicorn, celery) перечитывают справочник.
+    Версия сверяется не чаще раза в version_ttl секунд, а не на каждое
+    обращение: сериализатор запрашивает имя для каждой строки ответа.
+    '''
+
+    version_ttl = 1.0
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = Lock()
+        self.ids = None
+        self.names = None
+        self.version = None
+        self.checked_at = None
+        self.scope = f'dictionary:{model._meta.db_table}'
+
+    def __deepcopy__(self, memo):
+        # справочник общий для процесса, поля сериализаторов копируют ссылку на него
+        return self
+
+    def clear(self):
+        with self.lock:
+            self.ids = self.names = self.version = self.checked_at = None
+
+    def invalidate(self):
+        '''Сброс справочника во всех процессах: новая версия после фиксации транзакции'''
+
+        self.clear()
+        bump_on_commit(self.scope)
+
+    def load(self):
+        now = monotonic()
+        with self.lock:
+            if self.ids is not None and self.checked_at is not None and now - self.checked_at < self.version_ttl:
+                return self.ids, self.names
+        version, = versions([self.scope])
+        with self.lock:
+            if self.ids is None or self.version != version:
+                rows = list(self.model.objects.values_list('name', 'id'))
+                self.ids = dict(rows)
+                self.names = {id_: name for name, id_ in rows}
+                self.version = version
+            self.checked_at = now
+        return self.ids, self.names
+
+    def remember(self, rows):
+        ids, names = self.load()
+        for name, id_ in rows.items():
+            ids[name], names[id_] = id_, name
+
+    def get_ids(self, names):
+        '''Словарь name -> id для существующих строк'''
+
+        ids, _ = self.load()
+        found = {name: ids[name] for name in names if name in ids}
+        missing = set(names) - set(found)
+        if missing:
+            rows = dict(self.model.objects.filter(name__in=missing).values_list('name', 'id'))
+            found.update(rows)
+            if rows:
+                transaction.on_commit(lambda: self.remember(rows))
+        return found
+
+    def get_names(self, ids):
+        '''Словарь id -> name для существующих строк'''
+
+        _, names = self.load()
+        found = {id_: names[id_] for id_ in ids if id_ in names}
+        missing = set(ids) - set(found)
+        if missing:
+            rows = dict(self.model.objects.filter(id__in=missing).values_list('name', 'id'))
+            found.update((id_, name) for name, id_ in rows.items())
+            if rows:
+                transaction.on_commit(lambda: self.remember(rows))
+        return found
+
+    def get_name(self, id_):
+        return self.get_names([id_]).get(id_)
+
+
+parameters = ReferenceDictionary(Parameter)
+categories = ReferenceDictionary(Category)
@@ -0,0 +1,149 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Exists, OuterRef
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from shop.dictionaries import parameters
+from shop.models import Product, ProductInfo, Parameter, ProductParameter, ProductFacet, FacetCount
+
+
+PARAM_RE = re.compile(r'^param\[(.+)\]$')
+PRICE_PARAMS = (('price_min', 'price__gte', 'Минимальная цена'), ('price_max', 'price__lte', 'Максимальная цена'))
+
+
+def update_facets(product_ids, batch_size=1000):
+    '''
+    Пересборка значений фильтров продуктов: уникальные пары
+    (параметр, значение) по всем магазинам, где продается продукт.
+    Строки продуктов блокируются по возрастанию id: импорты разных
+    магазинов с общими продуктами пересобирают их по очереди.
+    Возвращает пары (параметр, значение), счетчики которых изменились.
+    '''
+
+    product_ids, pairs = sorted(set(product_ids)), set()
+    for start in range(0, len(product_ids), batch_size):
+        ids = product_ids[start:start + batch_size]
+        list(Product.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id'))
+        old = {
+            (product_id, parameter_id, value): id_ for id_, product_id, parameter_id, value in
+            ProductFacet.objects.filter(product_id__in=ids).values_list('id', 'product_id', 'parameter_id', 'value')
+        }
+        new = set(ProductParameter.objects.filter(product__product_id__in=ids).values_list(
+            'product__product_id', 'parameter_id', 'value'))
+        ProductFacet.objects.filter(id__in=[id_ for key, id_ in old.items() if key not in new]).delete()
+        ProductFacet.objects.bulk_create([
+            ProductFacet(product_id=product_id, parameter_id=parameter_id, value=value)
+            for product_id, parameter_id, value in new - old.keys()
+        ], ignore_conflicts=True)
+        pairs.update((parameter_id, value) for _, parameter_id, value in old.keys() ^ new)
+    return pairs
+
+
+def update_facet_counts(pairs=None, batch_size=1000):
+    '''
+    Количество продуктов по значениям фильтров для выдачи без фильтров:
+    пересчитываются только пары pairs, None - все значения. Строки
+    параметров блокируются, поэтому параллельные пересчеты одних
+    значений идут по очереди и видят зафиксированные строки друг друга.
+    Счетчики обновляются upsert, пары без продуктов удаляются.
+    '''
+
+    if pairs is None:
+        pairs = set(ProductFacet.objects.values_list('parameter_id', 'value').distinct()) | set(
+            FacetCount.objects.values_list('parameter_id', 'value'))
+    pairs = sorted(pairs)
+    list(Parameter.objects.select_for_update().filter(
+        id__in={parameter_id for parameter_id, _ in pairs}).order_by('id').values_list('id'))
+    for start in range(0, len(pairs), batch_size):
+        batch = set(pairs[start:start + batch_size])
+        # выборка по параметрам и значениям шире пар пачки, лишние пары отбрасываются
+        lookup = {
+            'parameter_id__in': {parameter_id for parameter_id, _ in batch},
+            'value__in': {value for _, value in batch}
+        }
+        counts = {
+            (parameter_id, value): products for parameter_id, value, products in ProductFacet.objects.filter(
+                **lookup).values_list('parameter_id', 'value').annotate(Count('product_id')).order_by()
+            if (parameter_id, value) in batch
+        }
+        FacetCount.objects.bulk_create([
+            FacetCount(parameter_id=parameter_id, value=value, products=products)
+            for (parameter_id, value), products in counts.items()
+        ], update_conflicts=True, unique_fields=['parameter_id', 'value'], update_fields=['products'])
+        FacetCount.objects.filter(id__in=[
+            id_ for id_, parameter_id, value in FacetCount.objects.filter(**lookup).values_list(
+                'id', 'parameter_id', 'value')
+            if (parameter_id, value) in batch and (parameter_id, value) not in counts
+        ]).delete()
+
+
+def facet_counts(queryset):
+    '''
+    Словарь {параметр: {значение: количество продуктов}} для выборки продуктов.
+    Для выборки без фильтров счетчики читаются из FacetCount, иначе считаются
+    по индексу ProductFacet только для продуктов выборки.
+    '''
+
+    if queryset.query.has_filters():
+        rows = ProductFacet.objects.filter(product_id__in=queryset.values('id')).values_list(
+            'parameter_id', 'value').annotate(Count('product_id')).order_by()
+    else:
+        rows = FacetCount.objects.values_list('parameter_id', 'value', 'products')
+    rows = list(rows)
+    names = parameters.get_names({parameter_id for parameter_id, _, _ in rows})
+    facets = {}
+    for parameter_id, value, count in sorted(rows, key=lambda row: (names[row[0]], row[1])):
+        facets.setdefault(names[parameter_id], {})[value] = count
+    return facets
+
+
+class ProductFacetFilter(BaseFilterBackend):
+    '''
+    Фильтрация продуктов по значениям параметров и цене:
+    param[Цвет]=красный (параметр можно повторить для нескольких значений),
+    price_min, price_max - цена хотя бы в одном магазине.
+    '''
+
+    def filter_queryset(self, request, queryset, view):
+        selected = {}
+        for key in request.query_params:
+            match = PARAM_RE.match(key)
+            if match:
+                selected[match.group(1)] = request.query_params.getlist(key)
+        if selected:
+            ids = parameters.get_ids(selected)
+            if len(ids) < len(selected):
+                return queryset.none()
+            for name, values in selected.items():
+                queryset = queryset.filter(Exists(ProductFacet.objects.filter(
+                    product_id=OuterRef('pk'), parameter_id=ids[name], value__in=values
+                )))
+
+        prices = {lookup: self.get_price(request, name) for name, lookup, _ in PRICE_PARAMS}
+        prices = {lookup: value for lookup, value in prices.items() if value is not None}
+        if prices:
+            queryset = queryset.filter(Exists(ProductInfo.objects.filter(product_id=OuterRef('pk'), **prices)))
+        return queryset
+
+    @staticmethod
+    def get_price(request, name):
+        value = request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            price = None
+        if price is None or not price.is_finite():
+            raise ValidationError({name: 'Введите число.'})
+        return price
+
+    def get_schema_fields(self, view):
+        return [
+            coreapi.Field(
+                name=name, required=False, location='query', schema=coreschema.Number(title=name, description=title)
+            ) for name, _, title in PRICE_PARAMS
+        ]
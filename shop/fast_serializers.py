@@ -0,0 +1,244 @@
+from decimal import Decimal
+
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+
+from shop.dictionaries import parameters
+from shop.models import Shop, Category, Product, ProductInfo, ProductParameter
+from shop.serializers import (
+    ProductParametersSerializer, ProductsViewSerializer, ProductInfoSerializer, ProductSerializer,
+    CategoryItemsViewSerializer, ShopItemsViewSerializer
+)
+
+
+# pk для подстановки в ссылку: адрес строится один раз, дальше подставляется id строки
+LINK_PK = 987654321987654321
+
+
+class Column:
+    '''Значение колонки .values() без преобразования (IntegerField, JSONField)'''
+
+    def __init__(self, source):
+        self.source = source
+
+    def convert(self, context):
+        return None
+
+    def compile(self, rows, context):
+        source, convert = self.source, self.convert(context)
+        if convert is None:
+            return lambda row: row[source]
+        return lambda row: None if row[source] is None else convert(row[source])
+
+
+class Text(Column):
+    '''CharField, StringRelatedField по колонке с названием'''
+
+    def __init__(self, source, template='{}'):
+        super().__init__(source)
+        self.template = template
+
+    def convert(self, context):
+        return self.template.format if self.template != '{}' else str
+
+
+class DecimalText(Column):
+    '''DecimalField: округление до decimal_places и строка, как в DRF'''
+
+    def __init__(self, source, decimal_places):
+        super().__init__(source)
+        self.quantum = Decimal('.1') ** decimal_places
+
+    def convert(self, context):
+        quantum = self.quantum
+        if not api_settings.COERCE_DECIMAL_TO_STRING:
+            return lambda value: value.quantize(quantum)
+        return lambda value: '{:f}'.format(value.quantize(quantum))
+
+
+class ReferenceName(Column):
+    '''ReferenceNameField: имя записи справочника по id'''
+
+    def __init__(self, source, dictionary):
+        super().__init__(source)
+        self.dictionary = dictionary
+
+    def convert(self, context):
+        return self.dictionary.get_name
+
+
+class Link(Column):
+    '''HyperlinkedIdentityField: ссылка на объект по id'''
+
+    def __init__(self, source, view_name):
+        super().__init__(source)
+        self.view_name = view_name
+
+    def convert(self, context):
+        url = reverse(self.view_name, kwargs={'pk': LINK_PK}, request=context.get('request'))
+        prefix, suffix = url.split(str(LINK_PK))
+        return lambda pk: f'{prefix}{pk}{suffix}'
+
+
+class Links(Link):
+    '''ShopLinksField: ссылки по списку id'''
+
+    def convert(self, context):
+        link = super().convert(context)
+        return lambda pks: [link(pk) for pk in pks]
+
+
+class Nested(Column):
+    '''
+    Вложенный список: строки связанной модели выбираются одним запросом
+    по id всех родительских строк (как prefetch_related) и группируются
+    по внешнему ключу related.
+    '''
+
+    def __init__(self, serializer, related, source='id'):
+        super().__init__(source)
+        self.serializer = serializer
+        self.related = related
+
+    def compile(self, rows, context):
+        source, related = self.source, self.related
+        children = list(self.serializer.Meta.model.objects.filter(
+            **{f'{related}__in': {row[source] for row in rows}}
+        ).values(*self.serializer.columns(), related))
+        groups = {}
+        for row, data in zip(children, self.serializer.represent(children, context)):
+            groups.setdefault(row[related], []).append(data)
+        return lambda row: groups.get(row[source], [])
+
+
+class ValuesSerializer:
+    '''
+    Сериализатор только для чтения по строкам .values(): поля читаются
+    из словаря строки заранее подготовленными функциями, без экземпляров
+    моделей и полей DRF. Ответ совпадает с ответом сериализатора Meta.serializer,
+    в том числе порядок полей. Интерфейс как у сериализатора DRF:
+    setup_queryset, конструктор с many и context, свойство data.
+    '''
+
+    fields = ()
+
+    class Meta:
+        model = None
+        serializer = None
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @classmethod
+    def columns(cls):
+        return list(dict.fromkeys(column.source for _, column in cls.fields))
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        # аннотации, по которым сортируется выборка (релевантность поиска), нужны для курсора страницы
+        ordering = {field.lstrip('-') for field in queryset.query.order_by if isinstance(field, str)}
+        annotations = [name for name in queryset.query.annotations if name in ordering]
+        return queryset.select_related(None).prefetch_related(None).values(*cls.columns(), *annotations)
+
+    @classmethod
+    def represent(cls, rows, context):
+        mappers = [(name, column.compile(rows, context)) for name, column in cls.fields]
+        return [{name: mapper(row) for name, mapper in mappers} for row in rows]
+
+    @property
+    def data(self):
+        if self.many:
+            return self.represent(list(self.instance), self.context)
+        return self.represent([self.instance], self.context)[0]
+
+
+class ProductParametersFastSerializer(ValuesSerializer):
+    fields = (
+        ('parameter', ReferenceName('parameter_id', parameters)),
+        ('value', Text('value')),
+    )
+
+    class Meta:
+        model = ProductParameter
+        serializer = ProductParametersSerializer
+
+
+class ProductInfoFastSerializer(ValuesSerializer):
+    fields = (
+        ('id', Column('id')),
+        ('product', Text('product__name')),
+        ('model', Text('model')),
+        # Shop.__str__
+        ('shop', Text('shop__name', '"{}"')),
+        ('article', Column('article')),
+        ('price', DecimalText('price', 2)),
+        ('quantity', Column('quantity')),
+        ('parameters', Nested(ProductParametersFastSerializer, 'product_id')),
+    )
+
+    class Meta:
+        model = ProductInfo
+        serializer = ProductInfoSerializer
+
+
+class ProductsViewFastSerializer(ValuesSerializer):
+    fields = (
+        ('id', Link('id', 'product-detail')),
+        ('name', Text('name')),
+        ('category', Text('card__category_name')),
+        ('rrc', Column('rrc')),
+        ('min_price', DecimalText('card__min_price', 2)),
+        ('max_price', DecimalText('card__max_price', 2)),
+        ('quantity', Column('card__quantity')),
+        ('shops', Links('card__shop_ids', 'shops-detail')),
+    )
+
+    class Meta:
+        model = Product
+        serializer = ProductsViewSerializer
+
+
+class ProductFastSerializer(ValuesSerializer):
+    fields = (
+        ('id', Link('id', 'product-detail')),
+        ('name', Text('name')),
+        ('rrc', Column('rrc')),
+        ('product_infos', Column('card__product_infos')),
+    )
+
+    class Meta:
+        model = Product
+        serializer = ProductSerializer
+
+
+class CategoryItemsViewFastSerializer(ValuesSerializer):
+    fields = (
+        ('name', Text('name')),
+        ('products', Nested(ProductsViewFastSerializer, 'category_id')),
+    )
+
+    class Meta:
+        model = Category
+        serializer = CategoryItemsViewSerializer
+
+
+class ShopItemsViewFastSerializer(ValuesSerializer):
+    fields = (
+        ('name', Text('name')),
+        ('product_infos', Nested(ProductInfoFastSerializer, 'shop_id')),
+    )
+
+    class Meta:
+        model = Shop
+        serializer = ShopItemsViewSerializer
+
+
+# сериализатор DRF -> быстрый сериализатор с тем же ответом
+FAST_SERIALIZERS = {
+    serializer.Meta.serializer: serializer for serializer in (
+        ProductsViewFastSerializer, ProductFastSerializer, CategoryItemsViewFastSerializer,
+        ShopItemsViewFastSerializer
+    )
+}
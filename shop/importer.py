@@ -0,0 +1,387 @@
+from contextlib import contextmanager
+from decimal import Decimal
+from time import perf_counter
+
+from django.db import transaction
+from django.db.models import F
+
+from shop.cache import bump, bump_shop
+from shop.cards import update_cards
+from shop.dictionaries import categories as category_names, parameters as parameter_names
+from shop.facets import update_facet_counts, update_facets
+from shop.models import (
+    Shop, Category, Product, ProductInfo, Parameter, ProductParameter, ImportJob, ImportShard
+)
+from shop.price_lists import PriceListError
+from shop.search import update_documents
+from shop.signals import product_signals_muted
+
+
+class PriceListImporter:
+    '''
+    Импорт прайс-листа магазина набором bulk-операций в три этапа.
+
+    stage - потоковый разбор файла: создаются магазин и категории,
+    продукты и параметры каждой пачки товаров разрешаются в id по
+    словарям, загруженным одним запросом, недостающие строки создаются
+    через bulk_create. Пачки сохраняются как части импорта (ImportShard).
+
+    plan - для каждой части вычисляется разница с уже загруженными
+    позициями магазина по ключу (shop, product, article). Этап только
+    читает данные, поэтому части можно обрабатывать параллельно.
+    План запоминает версию импорта магазина, на которой он построен.
+
+    finish - изменения всех частей применяются в одной транзакции,
+    удаляются только исчезнувшие из прайса позиции. Покупатели
+    не видят частично загруженный каталог. Если за время планирования
+    другой импорт этого магазина уже применил изменения, устаревшие
+    планы пересчитываются под блокировкой магазина.
+
+    Время и количество строк по каждому этапу собираются в отчет.
+    Для затронутых продуктов пересобираются поисковый документ, значения
+    фильтров и карточки (ProductCard), пересчитывается количество продуктов по фильтрам, после
+    фиксации изменений сбрасывается кеш каталога по магазину, затронутым
+    категориям и продуктам.
+    '''
+
+    product_info_fields = ('model', 'price', 'quantity')
+
+    def __init__(self, job, batch_size=1000):
+        self.job = job
+        self.batch_size = batch_size
+        self.shop = job.shop
+        self.shards = 0
+        self.rows = 0
+        self.timings = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + perf_counter() - start
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def report(self):
+        return {
+            'shop': self.shop.id,
+            'rows': self.rows,
+            'timings': {name: round(value, 4) for name, value in self.timings.items()},
+            'counts': self.counts
+        }
+
+    def save_progress(self):
+        '''Сохранение прогресса в задаче импорта после каждой пачки'''
+
+        report = self.report()
+        ImportJob.objects.filter(id=self.job.id).update(
+            rows_processed=self.rows, timings=report['timings'], counts=report['counts']
+        )
+
+    def run(self, sections):
+        '''Все этапы импорта в текущем процессе'''
+
+        self.stage(sections)
+        for shard in self.job.shards.all():
+            PriceListImporter(self.job, self.batch_size).plan(shard)
+        return self.finish()
+
+    def stage(self, sections):
+        '''
+        Импорт из последовательности пар (раздел, значение), например
+        из потокового чтения файла. Раздел "shop" должен идти первым,
+        разделы "categories" и "goods" могут повторяться.
+        Возвращает количество частей импорта.
+        '''
+
+        self.job.shards.all().delete()
+        for section, value in sections:
+            if section == 'shop':
+                with transaction.atomic():
+                    self.import_shop(value)
+            elif self.shop is None:
+                raise PriceListError('Раздел shop должен быть первым в прайс-листе')
+            elif section == 'categories':
+                with transaction.atomic():
+                    self.import_categories(value or [])
+            elif section == 'goods':
+                for start in range(0, len(value), self.batch_size):
+                    with transaction.atomic():
+                        self.stage_goods(value[start:start + self.batch_size])
+                    self.save_progress()
+        if self.shop is None:
+            raise PriceListError('В прайс-листе нет раздела shop')
+        self.save_progress()
+        return self.shards
+
+    def import_shop(self, shop_data):
+        with self.phase('shop'):
+            url = self.job.url
+            shop, created = Shop.objects.get_or_create(user_id=self.job.user_id, **shop_data)
+            if created and (not shop.url and not shop.filename):
+                separator = url.rfind('/')
+                shop.url = url[:separator + 1]
+                shop.filename = url[separator + 1:]
+                shop.save()
+            self.shop = self.job.shop = shop
+            ImportJob.objects.filter(id=self.job.id).update(shop=shop)
+
+    def import_categories(self, categories):
+        with self.phase('categories'):
+            names = {category['id']: category['name'] for category in categories}
+            existing = category_names.get_names(names)
+            new = [Category(id=id_, name=name) for id_, name in names.items() if id_ not in existing]
+            renamed = [
+                Category(id=id_, name=name) for id_, name in names.items()
+                if id_ in existing and existing[id_] != name
+            ]
+            Category.objects.bulk_create(new)
+            Category.objects.bulk_update(renamed, ['name'])
+            if new or renamed:
+                transaction.on_commit(category_names.clear)
+                scopes = ['catalog', *(f'category:{category.id}' for category in renamed)]
+                transaction.on_commit(lambda: bump(*scopes))
+            if renamed:
+                update_cards(
+                    Product.objects.filter(category_id__in=[category.id for category in renamed]).values_list(
+                        'id', flat=True), self.batch_size
+                )
+            Category.shops.through.objects.bulk_create(
+                [Category.shops.through(category_id=id_, shop_id=self.shop.id) for id_ in names],
+                ignore_conflicts=True
+            )
+            self.count('categories_created', len(new))
+            self.count('categories_updated', len(renamed))
+
+    def stage_goods(self, goods):
+        '''
+        Сохранение пачки товаров как части импорта. Продукты и параметры
+        разрешаются здесь, до параллельной обработки частей, поэтому
+        части не создают их одновременно.
+        '''
+
+        products = self.resolve_products(goods)
+        parameters = self.resolve_parameters(goods)
+        with self.phase('stage'):
+            ImportShard.objects.create(job=self.job, number=self.shards, goods=[
+                [
+                    products[self.product_key(item)], item['id'], item['model'], str(item['price']),
+                    item['quantity'], [[parameters[name], str(value)] for name, value in item['parameters'].items()]
+                ] for item in goods
+            ])
+        self.shards += 1
+        self.rows += len(goods)
+
+    @staticmethod
+    def product_key(item):
+        return item['name'], item['category'], item['price_rrc']
+
+    def resolve_products(self, goods):
+        '''Словарь (name, category, rrc) -> id продукта, недостающие продукты создаются'''
+
+        with self.phase('products'):
+            keys = {self.product_key(item) for item in goods}
+            products = self.load_products(keys)
+            new = [
+                Product(name=name, category_id=category, rrc=rrc)
+                for name, category, rrc in keys if (name, category, rrc) not in products
+            ]
+            if new:
+                Product.objects.bulk_create(new)
+                products = self.load_products(keys)
+                update_cards([products[(item.name, item.category_id, item.rrc)] for item in new], self.batch_size)
+            self.count('products_created', len(new))
+            return products
+
+    @staticmethod
+    def load_products(keys):
+        return {
+            (name, category, rrc): id_ for id_, name, category, rrc in Product.objects.filter(
+                name__in={key[0] for key in keys}
+            ).values_list('id', 'name', 'category_id', 'rrc')
+        }
+
+    def resolve_parameters(self, goods):
+        '''
+        Словарь name -> id параметра по кешу справочника, недостающие параметры
+        создаются. Имя параметра уникально, поэтому одновременное создание
+        одного параметра разными импортами не приводит к дубликатам.
+        '''
+
+        with self.phase('parameters'):
+            names = {name for item in goods for name in item['parameters']}
+            parameters = parameter_names.get_ids(names)
+            new = [Parameter(name=name) for name in names if name not in parameters]
+            if new:
+                Parameter.objects.bulk_create(new, ignore_conflicts=True)
+                parameters = parameter_names.get_ids(names)
+            self.count('parameters_created', len(new))
+            return parameters
+
+    def plan(self, shard):
+        '''
+        Сравнение части товаров с уже загруженными по ключу (shop, product, article):
+        новые позиции попадают в create, у существующих в update попадают только
+        измененные цена, количество и модель, в parameters_* - измененные параметры.
+        '''
+
+        with self.phase('plan'):
+            # версия читается до позиций: импорт, примененный между запросами, сделает план устаревшим
+            version = Shop.objects.filter(id=self.shop.id).values_list('import_version', flat=True).get()
+            existing = {
+                (row['product_id'], row['article']): row for row in ProductInfo.objects.filter(
+                    shop_id=self.shop.id, article__in={item[1] for item in shard.goods}
+                ).values('id', 'product_id', 'article', *self.product_info_fields)
+            }
+            current = {}
+            for id_, product_id, parameter_id, value in ProductParameter.objects.filter(
+                product_id__in=[row['id'] for row in existing.values()]
+            ).values_list('id', 'product_id', 'parameter_id', 'value'):
+                current.setdefault(product_id, {})[parameter_id] = (id_, value)
+
+            plan = {
+                'create': [], 'update': [], 'keep': [],
+                'parameters_create': [], 'parameters_update': [], 'parameters_delete': [], 'updated': []
+            }
+            updated = set()
+            for item in shard.goods:
+                product_id, article, model, price, quantity, parameters = item
+                row = existing.get((product_id, article))
+                if row is None:
+                    plan['create'].append(item)
+                    continue
+                plan['keep'].append(row['id'])
+                if (model, Decimal(price), quantity) != (row['model'], row['price'], row['quantity']):
+                    plan['update'].append([row['id'], model, price, quantity])
+                    updated.add(row['id'])
+                values = current.get(row['id'], {})
+                for parameter_id, value in parameters:
+                    if parameter_id not in values:
+                        plan['parameters_create'].append([row['id'], parameter_id, value])
+                        updated.add(row['id'])
+                        continue
+                    id_, current_value = values.pop(parameter_id)
+                    if current_value != value:
+                        plan['parameters_update'].append([id_, value])
+                        updated.add(row['id'])
+                if values:
+                    plan['parameters_delete'].extend(id_ for id_, _ in values.values())
+                    updated.add(row['id'])
+            plan['updated'] = sorted(updated)
+            plan['version'] = version
+
+        self.count('inserted', len(plan['create']))
+        self.count('updated', len(updated))
+        self.count('unchanged', len(plan['keep']) - len(updated))
+        shard.plan, shard.timings, shard.counts = plan, self.timings, self.counts
+        shard.save(update_fields=['plan', 'timings', 'counts'])
+
+    def finish(self):
+        '''
+        Применение изменений всех частей и удаление исчезнувших позиций
+        в одной транзакции. Строка магазина блокируется, чтобы два импорта
+        одного магазина не применялись одновременно.
+        '''
+
+        job = ImportJob.objects.get(id=self.job.id)
+        self.rows, self.timings, self.counts = job.rows_processed, dict(job.timings), dict(job.counts)
+        with transaction.atomic():
+            self.shop = Shop.objects.select_for_update().get(id=job.shop_id)
+            with self.phase('preload'):
+                products = dict(ProductInfo.objects.filter(shop_id=self.shop.id).values_list('id', 'product_id'))
+            stale, changed = set(products), set()
+            for shard in job.shards.all().iterator(chunk_size=1):
+                if shard.plan.get('version') != self.shop.import_version:
+                    self.replan(shard)
+                self.apply(shard.plan)
+                stale.difference_update(shard.plan['keep'])
+                changed.update(item[0] for item in shard.plan['create'])
+                changed.update(products[id_] for id_ in shard.plan['updated'])
+                for name, value in shard.timings.items():
+                    self.timings[name] = self.timings.get(name, 0) + value
+                for name, value in shard.counts.items():
+                    self.count(name, value)
+            self.delete_stale(stale)
+            Shop.objects.filter(id=self.shop.id).update(import_version=F('import_version') + 1)
+            job.shards.all().delete()
+            changed.update(products[id_] for id_ in stale)
+            with self.phase('search'):
+                update_documents(changed, self.batch_size)
+            with self.phase('facets'):
+                update_facet_counts(update_facets(changed, self.batch_size), self.batch_size)
+            with self.phase('cards'):
+                update_cards(changed, self.batch_size)
+            self.invalidate_cache(changed)
+        return self.report()
+
+    def replan(self, shard):
+        '''
+        Пересчет плана части, построенного до применения другого импорта
+        магазина: позиции, на которые он ссылается, могли быть изменены
+        или удалены. Вызывается под блокировкой магазина.
+        '''
+
+        planner = PriceListImporter(self.job, self.batch_size)
+        planner.shop = self.shop
+        planner.plan(shard)
+        self.count('shards_replanned', 1)
+
+    def invalidate_cache(self, product_ids):
+        '''Сброс кеша каталога по магазину, измененным продуктам и их категориям после фиксации'''
+
+        shop_id, product_ids, category_ids = self.shop.id, list(product_ids), set()
+        for start in range(0, len(product_ids), self.batch_size):
+            category_ids.update(Product.objects.filter(
+                id__in=product_ids[start:start + self.batch_size]
+            ).values_list('category_id', flat=True))
+        transaction.on_commit(lambda: bump_shop(shop_id, category_ids, product_ids))
+
+    def apply(self, plan):
+        with self.phase('product_infos'):
+            ProductInfo.objects.bulk_create([
+                ProductInfo(
+                    shop_id=self.shop.id, product_id=product_id, article=article, model=model,
+                    price=Decimal(price), quantity=quantity
+                ) for product_id, article, model, price, quantity, _ in plan['create']
+            ])
+            ProductInfo.objects.bulk_update([
+                ProductInfo(id=id_, model=model, price=Decimal(price), quantity=quantity)
+                for id_, model, price, quantity in plan['update']
+            ], self.product_info_fields)
+
+        with self.phase('product_parameters'):
+            created = {}
+            if plan['create']:
+                created = {
+                    (product_id, article): id_ for id_, product_id, article in ProductInfo.objects.filter(
+                        shop_id=self.shop.id, article__in={item[1] for item in plan['create']}
+                    ).values_list('id', 'product_id', 'article')
+                }
+            parameters = [
+                ProductParameter(product_id=created[(product_id, article)], parameter_id=parameter_id, value=value)
+                for product_id, article, _, _, _, values in plan['create'] for parameter_id, value in values
+            ]
+            parameters.extend(
+                ProductParameter(product_id=product_id, parameter_id=parameter_id, value=value)
+                for product_id, parameter_id, value in plan['parameters_create']
+            )
+            ProductParameter.objects.bulk_create(parameters)
+            ProductParameter.objects.bulk_update(
+                [ProductParameter(id=id_, value=value) for id_, value in plan['parameters_update']], ['value']
+            )
+            with product_signals_muted():
+                ProductParameter.objects.filter(id__in=plan['parameters_delete']).delete()
+
+    def delete_stale(self, stale):
+        '''Удаление позиций, которых больше нет в прайс-листе'''
+
+        with self.phase('delete'):
+            stale = list(stale)
+            with product_signals_muted():
+                for start in range(0, len(stale), self.batch_size):
+                    ProductInfo.objects.filter(id__in=stale[start:start + self.batch_size]).delete()
+            self.count('deleted', len(stale))
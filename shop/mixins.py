@@ -1,3 +1,12 @@
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from shop.cache import count, get_response, response_key, set_response, shared, validators
+from shop.fast_serializers import FAST_SERIALIZERS
+
+
 class MyPaginationMixin(object):
 
     @property
@@ -30,3 +39,119 @@ class MyPaginationMixin(object):
         """
         assert self.paginator is not None
         return self.paginator.get_paginated_response(data)
+
+
+class QueryPlanMixin(object):
+    """
+    Применяет к выборке связи, объявленные сериализатором
+    (select_related, prefetch_related), после фильтрации и до пагинации.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_queryset'):
+            queryset = serializer_class.setup_queryset(queryset)
+        return queryset
+
+
+class FastSerializerMixin(object):
+    """
+    Чтение через сериализатор по строкам .values() (shop.fast_serializers)
+    вместо сериализатора DRF с тем же ответом. Отключается настройкой
+    CATALOG_FAST_SERIALIZERS, схема API строится по сериализаторам DRF.
+    Ставится перед QueryPlanMixin.
+    """
+
+    def get_fast_serializer_class(self):
+        if not settings.CATALOG_FAST_SERIALIZERS or getattr(self, 'swagger_fake_view', False):
+            return None
+        return FAST_SERIALIZERS.get(self.get_serializer_class())
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fast_serializer_class = self.get_fast_serializer_class()
+        if fast_serializer_class is not None:
+            queryset = fast_serializer_class.setup_queryset(queryset)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fast_serializer_class = self.get_fast_serializer_class()
+        if fast_serializer_class is None:
+            return super().get_serializer(*args, **kwargs)
+        kwargs.setdefault('context', self.get_serializer_context())
+        return fast_serializer_class(*args, **kwargs)
+
+
+class CachedResponseMixin(object):
+    """
+    Кеширование ответов list/retrieve для анонимных пользователей.
+    Ответ хранится под ключом из адреса, параметров запроса, Accept
+    и версий областей каталога: list - "catalog", retrieve -
+    "<cache_scope>:<pk>". Изменение области (импорт, смена статуса
+    магазина) меняет ее версию, старые ответы больше не читаются.
+    В заголовке X-Cache возвращается HIT или MISS.
+    """
+
+    cache_scope = None
+
+    def get_cache_scopes(self):
+        if self.cache_scope and self.lookup_field in self.kwargs:
+            return [f'{self.cache_scope}:{self.kwargs[self.lookup_field]}']
+        return ['catalog']
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = response_key(request, self.get_cache_scopes())
+        data = get_response(key)
+        if data is not None:
+            count('hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+        count('misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_response(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class ConditionalGetMixin(object):
+    """
+    Условные GET-запросы (If-None-Match, If-Modified-Since) для list/retrieve.
+    Валидаторы вычисляются в get_validators до выборки и сериализации:
+    по умолчанию - по версиям областей каталога (get_cache_scopes),
+    только если кеш с версиями общий для процессов web и celery.
+    Если ресурс не изменился, возвращается 304 без тела.
+    """
+
+    def get_validators(self, request):
+        """Пара (ETag, Last-Modified как timestamp) или (None, None)"""
+        if not shared():
+            # версии в памяти процесса не меняются после импорта в celery: без валидаторов, а не 304 навсегда
+            return None, None
+        return validators(request, self.get_cache_scopes())
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
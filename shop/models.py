@@ -1,6 +1,9 @@
 
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
 
 from users.models import UserInfo
 
@@ -14,11 +17,21 @@ class Shop(models.Model):
     url = models.URLField(verbose_name="Ссылка(путь к файлу)", blank=True)
     filename = models.CharField(max_length=55, verbose_name="Имя файла", blank=True)
     is_open = models.BooleanField(verbose_name="Статус получения заказов", default=True)
+    price_list_sha256 = models.CharField(max_length=64, verbose_name="SHA-256 последнего прайс-листа", blank=True)
+    price_list_etag = models.CharField(max_length=255, verbose_name="ETag последнего прайс-листа", blank=True)
+    price_list_last_modified = models.CharField(
+        max_length=64, verbose_name="Last-Modified последнего прайс-листа", blank=True
+    )
+    # номер последнего примененного импорта: план части сверяется с ним перед применением
+    import_version = models.PositiveIntegerField(verbose_name="Версия импорта", default=0)
 
     class Meta:
         verbose_name = "Магазин"
         verbose_name_plural = "Магазины"
         ordering = ("name",)
+        indexes = [
+            models.Index(fields=['name', 'id'], name='shop_name_id_idx'),
+        ]
 
     def __str__(self):
         return f'"{self.name}"'
@@ -33,6 +46,9 @@ class Category(models.Model):
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
         ordering = ("name",)
+        indexes = [
+            models.Index(fields=['name', 'id'], name='category_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -44,16 +60,43 @@ class Product(models.Model):
     rrc = models.PositiveIntegerField(verbose_name="Рекомендованная розничная цена")
     shops = models.ManyToManyField(Shop, related_name="products",
                                    through="ProductInfo", through_fields=('product', 'shop'))
+    # название, модели и значения параметров; индексируется shop.search
+    search_document = models.TextField(verbose_name="Поисковый документ", blank=True, default='', editable=False)
 
     class Meta:
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
         ordering = ('name',)
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class ProductCard(models.Model):
+    """Денормализованная карточка продукта для списка и детальной страницы, обновляется shop.cards"""
+
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True,
+                                   verbose_name="Продукт", related_name="card")
+    category_name = models.CharField(max_length=50, verbose_name="Категория")
+    min_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name="Минимальная цена",
+                                    null=True, blank=True)
+    max_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name="Максимальная цена",
+                                    null=True, blank=True)
+    quantity = models.PositiveIntegerField(verbose_name="Количество в открытых магазинах", default=0)
+    shop_ids = models.JSONField(verbose_name="Магазины", default=list)
+    product_infos = models.JSONField(verbose_name="Предложения магазинов с параметрами", default=list)
+
+    class Meta:
+        verbose_name = "Карточка продукта"
+        verbose_name_plural = "Карточки продуктов"
+
+    def __str__(self):
+        return f'{self.product_id}: {self.min_price}-{self.max_price} р.'
+
+
 class ProductInfo(models.Model):
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, verbose_name="Магазин",
                              related_name="product_infos", blank=True)
@@ -74,7 +117,7 @@ class ProductInfo(models.Model):
 
 
 class Parameter(models.Model):
-    name = models.CharField(max_length=55, verbose_name="Параметр")
+    name = models.CharField(max_length=55, verbose_name="Параметр", unique=True)
 
     class Meta:
         verbose_name = "Параметр"
@@ -97,11 +140,47 @@ class ProductParameter(models.Model):
         verbose_name = "Параметр продукта"
         verbose_name_plural = "Параметры продукта"
         unique_together = ("product", "parameter")
+        indexes = [
+            models.Index(fields=['parameter', 'value'], name='productparameter_value_idx'),
+        ]
 
     def __str__(self):
         return f'{self.product}, {self.parameter}, {self.value}'
 
 
+class ProductFacet(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Продукт", related_name="facets")
+    parameter = models.ForeignKey(Parameter, on_delete=models.CASCADE, verbose_name="Параметр",
+                                  related_name="facets")
+    value = models.CharField(max_length=55, verbose_name="Значение")
+
+    class Meta:
+        verbose_name = "Значение фильтра продукта"
+        verbose_name_plural = "Значения фильтров продуктов"
+        unique_together = ("product", "parameter", "value")
+        indexes = [
+            models.Index(fields=['parameter', 'value', 'product'], name='productfacet_value_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product}, {self.parameter}: {self.value}'
+
+
+class FacetCount(models.Model):
+    parameter = models.ForeignKey(Parameter, on_delete=models.CASCADE, verbose_name="Параметр",
+                                  related_name="facet_counts")
+    value = models.CharField(max_length=55, verbose_name="Значение")
+    products = models.PositiveIntegerField(verbose_name="Количество продуктов")
+
+    class Meta:
+        verbose_name = "Количество продуктов по значению фильтра"
+        verbose_name_plural = "Количество продуктов по значениям фильтров"
+        unique_together = ("parameter", "value")
+
+    def __str__(self):
+        return f'{self.parameter}: {self.value} ({self.products})'
+
+
 class Order(models.Model):
     STATE_CHOICES = (
         ('basket', 'Корзина'),
@@ -112,6 +191,21 @@ class Order(models.Model):
         ('delivered', 'Доставлен'),
         ('canceled', 'Отменен'),
     )
+    # переходы для массовой смены статуса (shop.transitions): администратору - все, магазину - доставка
+    TRANSITIONS = (
+        ('new', 'confirmed'),
+        ('confirmed', 'assembled'),
+        ('assembled', 'sent'),
+        ('sent', 'delivered'),
+        ('new', 'canceled'),
+        ('confirmed', 'canceled'),
+        ('assembled', 'canceled'),
+    )
+    PARTNER_TRANSITIONS = (
+        ('confirmed', 'assembled'),
+        ('assembled', 'sent'),
+        ('sent', 'delivered'),
+    )
 
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Пользователь", related_name='orders'
@@ -122,15 +216,44 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Заказ создан")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Время последнего изменения статуса")
     status = models.CharField(max_length=10, choices=STATE_CHOICES, verbose_name="Текущий статус")
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма заказа", default=0)
+    stock_reserved = models.BooleanField(verbose_name="Товары зарезервированы", default=False)
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', 'status', 'updated_at'], name='order_user_status_updated_idx'),
+            models.Index(fields=['status', 'updated_at'], name='order_status_updated_idx'),
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+        ]
 
     def __str__(self):
         return f'Создан: {self.created_at}, статус: {self.status}'
 
+    def update_total(self):
+        '''
+        Пересчет суммы заказа одним запросом после изменения позиций:
+        по зафиксированным ценам позиций, для корзины - по текущим ценам
+        '''
+
+        self.total_price = self.ordered_items.aggregate(total=Sum(
+            F('quantity') * Coalesce('price', 'product__price'), output_field=DecimalField()
+        ))['total'] or 0
+        self.save(update_fields=['total_price', 'updated_at'])
+
+    def freeze_prices(self):
+        '''
+        Фиксация цен позиций при подтверждении заказа: сумма заказа
+        больше не меняется при обновлении прайс-листов магазинов
+        '''
+
+        self.ordered_items.filter(price__isnull=True).update(
+            price=Subquery(ProductInfo.objects.filter(id=OuterRef('product_id')).values('price')[:1])
+        )
+        self.update_total()
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE,
@@ -138,6 +261,8 @@ class OrderItem(models.Model):
     product = models.ForeignKey(ProductInfo, on_delete=models.CASCADE,
                                 related_name="in_orders", blank=True, verbose_name="Продукт")
     quantity = models.PositiveIntegerField(verbose_name="Количество", default=1)
+    price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name="Цена на момент заказа",
+                                null=True, blank=True)
 
     class Meta:
         verbose_name = "Позиция в заказе"
@@ -146,3 +271,83 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f'{self.product} - {self.quantity}'
+
+
+class ImportFile(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    file = models.FileField(upload_to='imports/', verbose_name="Файл")
+    size = models.PositiveBigIntegerField(verbose_name="Размер, байт")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Загружен")
+
+    class Meta:
+        verbose_name = "Файл импорта"
+        verbose_name_plural = "Файлы импорта"
+
+    def __str__(self):
+        return f'{self.file.name} ({self.size} байт)'
+
+
+class ImportJob(models.Model):
+    FORMAT_CHOICES = (
+        ('yaml', 'YAML'),
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    )
+    STATE_CHOICES = (
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Завершен'),
+        ('failed', 'Ошибка'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Пользователь", related_name='import_jobs'
+    )
+    url = models.URLField(verbose_name="Ссылка на файл")
+    format = models.CharField(max_length=5, choices=FORMAT_CHOICES, verbose_name="Формат", default='yaml')
+    file = models.ForeignKey(ImportFile, on_delete=models.PROTECT, verbose_name="Файл", related_name='jobs')
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, verbose_name="Магазин", related_name='import_jobs',
+                             null=True, blank=True)
+    etag = models.CharField(max_length=255, verbose_name="ETag", blank=True)
+    last_modified = models.CharField(max_length=64, verbose_name="Last-Modified", blank=True)
+    status = models.CharField(max_length=10, choices=STATE_CHOICES, verbose_name="Статус", default='pending')
+    rows_processed = models.PositiveIntegerField(verbose_name="Обработано товаров", default=0)
+    timings = models.JSONField(verbose_name="Длительность этапов, с", default=dict, blank=True)
+    counts = models.JSONField(verbose_name="Количество строк по этапам", default=dict, blank=True)
+    error = models.TextField(verbose_name="Ошибка", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    started_at = models.DateTimeField(verbose_name="Начат", null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name="Завершен", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Импорт товаров"
+        verbose_name_plural = "Импорты товаров"
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'Импорт №{self.id} {self.url}, статус: {self.status}'
+
+    @property
+    def rows_per_second(self):
+        if self.started_at is None:
+            return None
+        duration = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.rows_processed / duration, 1) if duration > 0 else None
+
+
+class ImportShard(models.Model):
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, verbose_name="Импорт", related_name='shards')
+    number = models.PositiveIntegerField(verbose_name="Номер")
+    goods = models.JSONField(verbose_name="Товары")
+    plan = models.JSONField(verbose_name="Изменения", null=True, blank=True)
+    timings = models.JSONField(verbose_name="Длительность этапов, с", default=dict, blank=True)
+    counts = models.JSONField(verbose_name="Количество строк по этапам", default=dict, blank=True)
+
+    class Meta:
+        verbose_name = "Часть импорта"
+        verbose_name_plural = "Части импорта"
+        ordering = ('job', 'number')
+        unique_together = ('job', 'number')
+
+    def __str__(self):
+        return f'Импорт №{self.job_id}, часть {self.number}'
@@ -0,0 +1,194 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Постраничный вывод по ключу сортировки вместо номера страницы.
+    Курсор - значения полей сортировки последней строки предыдущей
+    страницы, следующая страница выбирается условием WHERE ключ > курсор
+    по индексу, без OFFSET. Сортировка берется из выборки (например,
+    по релевантности поиска), атрибута ordering представления или Meta
+    модели и дополняется id, чтобы ключ был уникальным.
+    Общее количество считается только по запросу с count=true,
+    для больших таблиц без фильтров - оценка из статистики PostgreSQL.
+    Сериализуется только текущая страница.
+    '''
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-pk',)
+    # с какого размера таблицы COUNT(*) заменяется оценкой из pg_class
+    approximate_count_threshold = 100000
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.keyset = self.get_ordering(queryset, view)
+        self.count = self.get_count(queryset) if self.count_requested(request) else None
+        queryset = queryset.order_by(*self.keyset)
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_ordering(self, queryset, view):
+        ordering = tuple(queryset.query.order_by) or getattr(view, 'ordering', None) or \
+            queryset.model._meta.ordering or self.ordering
+        if not all(isinstance(field, str) for field in ordering):
+            raise TypeError('Сортировка для постраничного вывода по ключу задается именами полей')
+        if not {'pk', '-pk', 'id', '-id'} & set(ordering):
+            ordering = (*ordering, '-pk' if ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    def after(self, cursor):
+        '''
+        Условие "строка после курсора" для ключа из нескольких полей:
+        (a > x) OR (a = x AND b > y) OR ... Для первого поля добавляется
+        условие a >= x, по которому выбирается диапазон индекса.
+        '''
+
+        fields = [(field.lstrip('-'), 'lt' if field.startswith('-') else 'gt') for field in self.keyset]
+        conditions, equal = [], {}
+        for (field, lookup), value in zip(fields, cursor):
+            conditions.append(Q(**equal, **{f'{field}__{lookup}': value}))
+            equal[field] = value
+        first, lookup = fields[0]
+        return Q(**{f'{first}__{lookup}e': cursor[0]}) & reduce(lambda left, right: left | right, conditions)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def count_requested(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('true', '1')
+
+    def get_count(self, queryset):
+        '''Количество строк выборки, для большой таблицы без фильтров - оценка'''
+
+        database = connections[queryset.db]
+        if database.vendor == 'postgresql' and not queryset.query.has_filters():
+            with database.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= self.approximate_count_threshold:
+                return row[0]
+        return queryset.order_by().count()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (DecodeError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor, list) or len(cursor) != len(self.keyset):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [self.decode_value(model, field, value) for field, value in zip(self.keyset, cursor)]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def decode_value(model, field, value):
+        '''Значение курсора, приведенное к типу поля сортировки'''
+
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise TypeError(value)
+        path = field.lstrip('-').split('__')
+        try:
+            for name in path[:-1]:
+                model = model._meta.get_field(name).related_model
+            model_field = model._meta.pk if path[-1] == 'pk' else model._meta.get_field(path[-1])
+        except (AttributeError, FieldDoesNotExist):
+            # аннотация выборки, например релевантность поиска
+            if isinstance(value, str):
+                raise TypeError(value)
+            return value
+        if value is None:
+            if not model_field.null:
+                raise ValueError(value)
+            return None
+        return model_field.to_python(value)
+
+    def encode_cursor(self, instance):
+        values = []
+        for field in self.keyset:
+            field = field.lstrip('-')
+            if isinstance(instance, dict):
+                # строка .values()
+                values.append(instance['id' if field == 'pk' else field])
+                continue
+            value = instance
+            for attr in field.split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return urlsafe_b64encode(json.dumps(values, default=self.encode_value).encode()).decode()
+
+    @staticmethod
+    def encode_value(value):
+        # isoformat с микросекундами: курсор должен точно совпадать со значением в базе
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'description': 'только при count=true'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_fields(self, view):
+        return [
+            coreapi.Field(
+                name=self.cursor_query_param, required=False, location='query',
+                schema=coreschema.String(title='Курсор', description='курсор страницы из ссылки next')
+            ),
+            coreapi.Field(
+                name=self.page_size_query_param, required=False, location='query',
+                schema=coreschema.Integer(title='Размер страницы', description='количество записей на странице')
+            ),
+            coreapi.Field(
+                name=self.count_query_param, required=False, location='query',
+                schema=coreschema.Boolean(title='Количество', description='вернуть общее количество записей')
+            ),
+        ]
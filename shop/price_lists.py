@@ -0,0 +1,193 @@
+from csv import DictReader
+from io import TextIOWrapper
+
+from yaml.events import (
+    AliasEvent, DocumentStartEvent, MappingEndEvent, MappingStartEvent,
+    ScalarEvent, SequenceEndEvent, SequenceStartEvent, StreamStartEvent
+)
+from yaml.nodes import ScalarNode
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    from ujson import loads
+except ImportError:
+    from json import loads
+
+
+EXTENSIONS = {'.yaml': 'yaml', '.yml': 'yaml', '.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+CONTENT_TYPES = {
+    'application/x-yaml': 'yaml', 'application/yaml': 'yaml', 'text/yaml': 'yaml', 'text/x-yaml': 'yaml',
+    'text/csv': 'csv', 'application/csv': 'csv',
+    'application/jsonl': 'jsonl', 'application/x-jsonlines': 'jsonl', 'application/x-ndjson': 'jsonl',
+}
+CSV_COLUMNS = ('shop', 'category', 'category_name', 'id', 'model', 'name', 'price', 'price_rrc', 'quantity')
+
+
+class PriceListError(ValueError):
+    '''Ошибка структуры прайс-листа'''
+
+
+def detect_format(filename, content_type=None):
+    '''Формат прайс-листа по расширению файла или Content-Type, None если не определен'''
+
+    for extension, format_ in EXTENSIONS.items():
+        if filename.lower().endswith(extension):
+            return format_
+    if content_type:
+        return CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+    return None
+
+
+def read_price_list(format_, stream, batch_size):
+    '''Потоковое чтение прайс-листа в формате yaml, csv или jsonl из бинарного потока'''
+
+    return READERS[format_](stream, batch_size)
+
+
+def read_yaml(stream, batch_size):
+    '''
+    Потоковое чтение yaml прайс-листа через event API libyaml.
+    Возвращает пары (раздел, значение): разделы "shop" и "categories"
+    целиком, товары из раздела "goods" - пачками по batch_size,
+    так что в памяти одновременно находится не больше одной пачки.
+    '''
+
+    loader = SafeLoader(stream)
+    try:
+        for event in (StreamStartEvent, DocumentStartEvent, MappingStartEvent):
+            if not loader.check_event(event):
+                raise PriceListError('Прайс-лист должен содержать разделы shop, categories, goods')
+            loader.get_event()
+
+        while not loader.check_event(MappingEndEvent):
+            section = _read_value(loader)
+            if section != 'goods':
+                yield section, _read_value(loader)
+                continue
+            if not loader.check_event(SequenceStartEvent):
+                raise PriceListError('Раздел goods должен быть списком')
+            loader.get_event()
+            batch = []
+            while not loader.check_event(SequenceEndEvent):
+                batch.append(_read_value(loader))
+                if len(batch) == batch_size:
+                    yield section, batch
+                    batch = []
+            loader.get_event()
+            if batch:
+                yield section, batch
+    finally:
+        loader.dispose()
+
+
+def _read_value(loader):
+    '''Сборка одного значения (скаляр, список, словарь) из событий парсера'''
+
+    event = loader.get_event()
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, event.style)
+        constructor = loader.yaml_constructors.get(tag, loader.yaml_constructors[None])
+        return constructor(loader, node)
+    if isinstance(event, SequenceStartEvent):
+        items = []
+        while not loader.check_event(SequenceEndEvent):
+            items.append(_read_value(loader))
+        loader.get_event()
+        return items
+    if isinstance(event, MappingStartEvent):
+        mapping = {}
+        while not loader.check_event(MappingEndEvent):
+            key = _read_value(loader)
+            mapping[key] = _read_value(loader)
+        loader.get_event()
+        return mapping
+    if isinstance(event, AliasEvent):
+        raise PriceListError('Ссылки (alias) в прайс-листе не поддерживаются')
+    raise PriceListError(f'Неожиданный элемент прайс-листа: {event}')
+
+
+def read_jsonl(stream, batch_size):
+    '''
+    Потоковое чтение прайс-листа в формате JSON Lines: каждая строка -
+    отдельный объект. Строки с ключом "shop" или "categories" задают
+    одноименные разделы, остальные строки - товары в том же виде,
+    что и в разделе goods yaml файла.
+    '''
+
+    batch = []
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            item = loads(line)
+        except ValueError:
+            raise PriceListError(f'Строка {number}: некорректный JSON')
+        section = next((key for key in ('shop', 'categories') if key in item), None)
+        if section is None:
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield 'goods', batch
+                batch = []
+            continue
+        if batch:
+            yield 'goods', batch
+            batch = []
+        yield section, item[section]
+    if batch:
+        yield 'goods', batch
+
+
+def read_csv(stream, batch_size):
+    '''
+    Потоковое чтение прайс-листа в формате csv с заголовком.
+    Обязательные колонки: shop, category, id, model, name, price,
+    price_rrc, quantity; category_name - название категории.
+    Остальные колонки - параметры товара, пустые значения пропускаются.
+    Категории передаются импортеру перед каждой пачкой товаров, в которой
+    они впервые встретились.
+    '''
+
+    reader = DictReader(TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    missing = set(CSV_COLUMNS) - {'category_name'} - set(reader.fieldnames or ())
+    if missing:
+        raise PriceListError(f'В csv файле нет колонок: {", ".join(sorted(missing))}')
+    parameters = [name for name in reader.fieldnames if name not in CSV_COLUMNS]
+
+    shop, seen, categories, batch = None, set(), [], []
+    for row in reader:
+        if shop is None:
+            shop = row['shop']
+            yield 'shop', {'name': shop}
+        try:
+            item = {
+                'id': int(row['id']), 'category': int(row['category']), 'model': row['model'],
+                'name': row['name'], 'price': row['price'], 'price_rrc': int(row['price_rrc']),
+                'quantity': int(row['quantity']),
+                'parameters': {name: row[name] for name in parameters if row[name]}
+            }
+        except (TypeError, ValueError):
+            raise PriceListError(f'Строка {reader.line_num}: некорректные значения')
+        if item['category'] not in seen and row.get('category_name'):
+            seen.add(item['category'])
+            categories.append({'id': item['category'], 'name': row['category_name']})
+        batch.append(item)
+        if len(batch) == batch_size:
+            if categories:
+                yield 'categories', categories
+                categories = []
+            yield 'goods', batch
+            batch = []
+    if categories:
+        yield 'categories', categories
+    if batch:
+        yield 'goods', batch
+
+
+READERS = {'yaml': read_yaml, 'csv': read_csv, 'jsonl': read_jsonl}
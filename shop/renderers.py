@@ -0,0 +1,88 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders, json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# Типы, которых нет в JSON (Decimal, datetime, ленивые строки...), кодируются так же, как в DRF
+default = encoders.JSONEncoder().default
+
+
+def dumps_orjson(data, ensure_ascii):
+    if ensure_ascii:
+        return None
+    # datetime передаются в default: формат DRF (миллисекунды, Z), а не RFC 3339 orjson
+    return orjson.dumps(data, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_ujson(data, ensure_ascii):
+    return ujson.dumps(
+        data, ensure_ascii=ensure_ascii, escape_forward_slashes=False, allow_nan=False, default=default
+    ).encode()
+
+
+if orjson is not None:
+    backend, fast_dumps, fast_loads = 'orjson', dumps_orjson, orjson.loads
+elif ujson is not None:
+    backend, fast_dumps, fast_loads = 'ujson', dumps_ujson, ujson.loads
+else:
+    backend, fast_dumps, fast_loads = 'json', None, None
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''
+    JSON через orjson или ujson, если они установлены, иначе стандартный
+    JSONRenderer. Вывод совпадает с JSONRenderer: компактные разделители,
+    Decimal - число, даты в формате DRF. Ответы с отступами (indent
+    в Accept, Browsable API) и нестрогий режим отдаются JSONRenderer.
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if fast_dumps is None or not (self.compact and self.strict) or \
+                self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = fast_dumps(data, self.ensure_ascii)
+        except (TypeError, OverflowError):
+            # NaN, бесконечность и целые больше 64 бит - как в JSONRenderer
+            ret = None
+        if ret is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # \u2028 и \u2029 экранируются, как в JSONRenderer: ответ остается подмножеством javascript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    '''Разбор тела запроса через orjson или ujson, иначе стандартный JSONParser'''
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if fast_loads is None:
+            return super().parse(stream, media_type, parser_context)
+
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            content = stream.read().decode(encoding)
+            if self.strict and backend == 'ujson' and ('NaN' in content or 'Infinity' in content):
+                # ujson принимает NaN и бесконечности, JSONParser в строгом режиме - нет
+                return json.loads(content, parse_constant=json.strict_constant)
+            return fast_loads(content)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,114 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from shop.models import Product, ProductInfo, ProductParameter
+
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'shop_product_fts'
+
+POSTGRES_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    # выражение совпадает с тем, что строит SearchVector('search_document', config=SEARCH_CONFIG)
+    f"CREATE INDEX IF NOT EXISTS shop_product_search_idx ON shop_product "
+    f"USING gin (to_tsvector('{SEARCH_CONFIG}'::regconfig, COALESCE(search_document, '')))",
+    'CREATE INDEX IF NOT EXISTS shop_product_search_trgm_idx ON shop_product '
+    'USING gin (search_document gin_trgm_ops)',
+)
+# Внешняя FTS5 таблица поверх shop_product, триггеры держат ее в актуальном состоянии
+SQLITE_INDEXES = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"search_document, content='shop_product', content_rowid='id', tokenize='unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON shop_product BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON shop_product BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document) "
+    f"VALUES ('delete', old.id, old.search_document); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF search_document ON shop_product BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document) "
+    f"VALUES ('delete', old.id, old.search_document); "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+
+def install_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    '''
+    Индексы полнотекстового поиска, которые нельзя описать в Meta модели:
+    в PostgreSQL - GIN индексы по tsvector и триграммам, в SQLite - таблица FTS5.
+    Вызывается после migrate, продукты без поискового документа дозаполняются.
+    '''
+
+    database = connections[using]
+    statements = {'postgresql': POSTGRES_INDEXES, 'sqlite': SQLITE_INDEXES}.get(database.vendor, ())
+    with database.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    update_documents(Product.objects.using(using).filter(search_document='').values_list('id', flat=True))
+
+
+def update_documents(product_ids, batch_size=1000):
+    '''
+    Пересборка поискового документа продуктов: название, модели
+    у всех магазинов и значения параметров.
+    '''
+
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        ids = product_ids[start:start + batch_size]
+        words = {id_: [name] for id_, name in Product.objects.filter(id__in=ids).values_list('id', 'name')}
+        for product_id, model in ProductInfo.objects.filter(
+                product_id__in=words).values_list('product_id', 'model'):
+            words[product_id].append(model)
+        for product_id, value in ProductParameter.objects.filter(
+                product__product_id__in=words).values_list('product__product_id', 'value'):
+            words[product_id].append(value)
+        Product.objects.bulk_update([
+            Product(id=id_, search_document=' '.join(dict.fromkeys(values))) for id_, values in words.items()
+        ], ['search_document'])
+
+
+def search_products(queryset, text):
+    '''
+    Поиск продуктов по поисковому документу с сортировкой по релевантности.
+    PostgreSQL: полнотекстовый поиск (словарь russian) или похожесть
+    по триграммам для опечаток. SQLite: FTS5 с ранжированием bm25.
+    Остальные базы: поиск подстроки.
+    '''
+
+    words = re.findall(r'\w+', text)
+    if not words:
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='plain')
+        vector = SearchVector('search_document', config=SEARCH_CONFIG)
+        return queryset.annotate(search=vector).filter(
+            Q(search=query) | Q(search_document__trigram_word_similar=text)
+        ).annotate(
+            rank=SearchRank(vector, query) + TrigramWordSimilarity(text, 'search_document')
+        ).order_by('-rank', 'id')
+    if connection.vendor == 'sqlite':
+        match = ' '.join('"%s"*' % word for word in words)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+        ).annotate(rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = shop_product.id',
+            (match,)
+        )).order_by('rank', 'id')
+    query = Q()
+    for word in words:
+        query &= Q(search_document__icontains=word)
+    return queryset.filter(query)
+
+
+class ProductSearchFilter(SearchFilter):
+    '''Поиск продуктов по параметру search через поисковый индекс'''
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        return search_products(queryset, text) if text.strip() else queryset
@@ -1,15 +1,101 @@
 
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
-from shop.models import Shop, Category, Product, ProductInfo, ProductParameter, Order, OrderItem
+from shop.dictionaries import parameters
+from shop.models import Shop, Category, Product, ProductInfo, ProductParameter, Order, OrderItem, ImportJob
 from users.serializers import UserContactsViewSerializer
 
 
+def is_integer(value):
+    '''Целое число из JSON: bool - подкласс int, но id или количеством не считается'''
+
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class ReferenceNameField(serializers.Field):
+    '''Имя записи справочника по id из кеша, без join и отдельного запроса'''
+
+    def __init__(self, dictionary, **kwargs):
+        self.dictionary = dictionary
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.dictionary.get_name(value)
+
+
+class ShopLinksField(serializers.Field):
+    '''Ссылки на магазины по списку id, без запроса к таблице магазинов'''
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return [reverse('shops-detail', kwargs={'pk': shop_id}, request=request) for shop_id in value]
+
+
+class QueryPlanSerializerMixin:
+    '''
+    Сериализатор объявляет связи, которые он читает: select_related -
+    связи "один к одному" и внешние ключи, prefetch_related - обратные
+    связи. Элемент prefetch_related - строка или пара (связь, сериализатор),
+    для пары связанные строки выбираются запросом, подготовленным вложенным
+    сериализатором. Количество запросов не зависит от размера выборки.
+    '''
+
+    select_related = ()
+    prefetch_related = ()
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        for lookup in cls.prefetch_related:
+            if not isinstance(lookup, str):
+                lookup, serializer = lookup
+                lookup = Prefetch(lookup, queryset=serializer.setup_queryset(serializer.Meta.model.objects.all()))
+            queryset = queryset.prefetch_related(lookup)
+        return queryset
+
+
 class URLSerializer(serializers.Serializer): # noqa
     url = serializers.URLField(write_only=True, required=True, label='URL адрес для импорта товаров')
 
 
-class ShopsViewSerializer(serializers.ModelSerializer):
+class PartnerOrderStatusSerializer(serializers.Serializer): # noqa
+    '''Массовая смена статуса заказов магазином'''
+
+    orders = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=5000, label='id заказов'
+    )
+    from_status = serializers.ChoiceField(choices=Order.STATE_CHOICES, label='Текущий статус заказов')
+    status = serializers.ChoiceField(choices=Order.STATE_CHOICES, label='Новый статус заказов')
+
+    def validate(self, data):
+        if (data['from_status'], data['status']) not in Order.PARTNER_TRANSITIONS:
+            raise serializers.ValidationError(
+                {'status': f'Переход из статуса "{data["from_status"]}" в "{data["status"]}" не поддерживается'}
+            )
+        return data
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    '''Сериализатор статуса импорта товаров'''
+
+    rows_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'url', 'status', 'rows_processed', 'rows_per_second', 'timings', 'counts',
+                  'error', 'created_at', 'started_at', 'finished_at')
+
+
+class ShopsViewSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для списка магазинов'''
 
     id = serializers.HyperlinkedIdentityField(view_name='shops-detail')
@@ -20,7 +106,7 @@ class ShopsViewSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'site', 'is_open')
 
 
-class CategoriesViewSerializer(serializers.ModelSerializer):
+class CategoriesViewSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для списка категорий'''
 
     id = serializers.HyperlinkedIdentityField(view_name='categories-detail')
@@ -30,87 +116,107 @@ class CategoriesViewSerializer(serializers.ModelSerializer):
         fields = ('id', 'name')
 
 
-class ProductParametersSerializer(serializers.ModelSerializer):
+class ProductParametersSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор параметров продукта'''
-    parameter = serializers.StringRelatedField()
+    parameter = ReferenceNameField(parameters, source='parameter_id')
 
     class Meta:
         model = ProductParameter
         fields = ('parameter', 'value')
 
 
-class ProductsViewSerializer(serializers.ModelSerializer):
+class ProductsViewSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для списка всех продуктов с уточнением наличия в магазинах'''
     id = serializers.HyperlinkedIdentityField(read_only=True, view_name='product-detail')
-    shops = serializers.HyperlinkedRelatedField(read_only=True, many=True, view_name='shops-detail')
-    category = serializers.StringRelatedField()
+    shops = ShopLinksField(source='card.shop_ids')
+    category = serializers.CharField(source='card.category_name', read_only=True)
+    min_price = serializers.DecimalField(source='card.min_price', max_digits=9, decimal_places=2, read_only=True)
+    max_price = serializers.DecimalField(source='card.max_price', max_digits=9, decimal_places=2, read_only=True)
+    quantity = serializers.IntegerField(source='card.quantity', read_only=True)
+
+    select_related = ('card',)
 
     class Meta:
         model = Product
-        fields = ('id', 'name', 'category', 'rrc', 'shops')
+        fields = ('id', 'name', 'category', 'rrc', 'min_price', 'max_price', 'quantity', 'shops')
 
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор информации о продуктах'''
 
     product = serializers.StringRelatedField()
     parameters = ProductParametersSerializer(many=True)
     shop = serializers.StringRelatedField()
 
+    select_related = ('product', 'shop')
+    prefetch_related = (('parameters', ProductParametersSerializer),)
+
     class Meta:
         model = ProductInfo
         fields = ('id', 'product', 'model', 'shop', 'article', 'price', 'quantity', 'parameters')
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор подробной информации о конкретном продукте'''
 
     id = serializers.HyperlinkedIdentityField(view_name='product-detail')
-    product_infos = ProductInfoSerializer(many=True)
+    # предложения магазинов сериализуются заранее при обновлении карточки (shop.cards)
+    product_infos = serializers.JSONField(source='card.product_infos', read_only=True)
+
+    select_related = ('card',)
 
     class Meta:
         model = Product
         fields = ('id', 'name', 'rrc', 'product_infos')
 
 
-class CategoryItemsViewSerializer(serializers.ModelSerializer):
+class CategoryItemsViewSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для товаров определенной категории'''
 
     products = ProductsViewSerializer(many=True)
 
+    prefetch_related = (('products', ProductsViewSerializer),)
+
     class Meta:
         model = Category
         fields = ('name', 'products')
 
 
-class ShopItemsViewSerializer(serializers.ModelSerializer):
+class ShopItemsViewSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для товаров одного магазина'''
 
     product_infos = ProductInfoSerializer(many=True)
 
+    prefetch_related = (('product_infos', ProductInfoSerializer),)
+
     class Meta:
         model = Shop
         fields = ('name', 'product_infos')
 
 
-class OrderedItemsSerializer(serializers.ModelSerializer):
+class OrderedItemsSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор просмотра товаров в заказе'''
 
     product = ProductInfoSerializer()
 
+    select_related = ('product__product', 'product__shop')
+    prefetch_related = ('product__parameters',)
+
     class Meta:
         model = OrderItem
-        fields = ('id', 'order', 'product', 'quantity')
+        fields = ('id', 'order', 'product', 'quantity', 'price')
         extra_kwargs = {'order': {"write_only": True}}
 
 
-class BasketSerializer(serializers.ModelSerializer):
+class BasketSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор товаров в корзине'''
 
     contacts = UserContactsViewSerializer(required=False, allow_null=True)
     ordered_items = OrderedItemsSerializer(many=True, read_only=True)
     total_price = serializers.IntegerField(read_only=True)
 
+    prefetch_related = (('ordered_items', OrderedItemsSerializer),)
+
     class Meta:
         model = Order
         fields = ('id', 'status', 'contacts', 'ordered_items', 'total_price')
@@ -119,80 +225,101 @@ class BasketSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         items = validated_data.pop('items')
 
-        basket, _ = Order.objects.get_or_create(**validated_data)
-
-        for item in items:
-            OrderItem.objects.update_or_create(
-                order=basket,
-                product_id=item['product'],
-                defaults={'quantity': item.get('quantity', 1)}
-            )
+        with transaction.atomic():
+            # строка корзины блокируется до конца транзакции: параллельные изменения выполняются по очереди
+            basket, _ = Order.objects.select_for_update().get_or_create(**validated_data)
+            self.save_items(basket, items)
+            # время изменения нужно для ETag
+            basket.update_total()
         return basket
 
     def update(self, instance, validated_data):
 
         items = validated_data.pop('items')
-        instance.ordered_items.all().delete()
-        instance = super().update(instance, validated_data)
-
-        for item in items:
-            OrderItem.objects.create(
-                order=instance,
-                product_id=item['product'],
-                quantity=item.get('quantity', 1)
-            )
+        with transaction.atomic():
+            Order.objects.select_for_update().get(pk=instance.pk)
+            instance.ordered_items.exclude(product_id__in=[item['product'] for item in items]).delete()
+            instance = super().update(instance, validated_data)
+            self.save_items(instance, items)
+            instance.update_total()
         return instance
 
+    @staticmethod
+    def save_items(basket, items):
+        '''Вставка или обновление количества всех позиций одним запросом'''
+
+        # для повторяющегося товара действует последнее количество
+        quantities = {item['product']: item.get('quantity', 1) for item in items}
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=basket, product_id=product_id, quantity=quantity)
+             for product_id, quantity in quantities.items()],
+            update_conflicts=True, unique_fields=['order_id', 'product_id'], update_fields=['quantity']
+        )
+
     def validate(self, attrs):
+        '''
+        Проверка наличия товаров одним запросом только по переданным id.
+        Возвращаются ошибки по всем позициям сразу.
+        '''
         attrs = self.initial_data
 
-        products_quantity = {
-            product: quantity for product, quantity in ProductInfo.objects.filter(
-                shop__is_open=True).values_list('id', 'quantity')
+        items, errors = attrs['items'], {}
+        requested = {
+            item['product'] for item in items
+            if isinstance(item, dict) and is_integer(item.get('product'))
         }
-        items = attrs['items']
+        products_quantity = dict(ProductInfo.objects.filter(
+            id__in=requested, shop__is_open=True).values_list('id', 'quantity'))
         for item in items:
             try:
                 product_id = item['product']
                 quantity = item['quantity']
-            except KeyError:
-                raise serializers.ValidationError(
-                    {'fields': 'поля для передачи: "product", "quantity"'}
+            except (KeyError, TypeError):
+                errors.setdefault('fields', []).append('поля для передачи: "product", "quantity"')
+                continue
+            if not is_integer(product_id) or product_id not in products_quantity:
+                errors.setdefault('product', []).append(
+                    f"Продукта с id {product_id} не существует или магазин не принимает заказы"
                 )
-            else:
-                if product_id not in products_quantity:
-                    raise serializers.ValidationError(
-                        {'product': f"Продукта с id {product_id} не существует или магазин не принимает заказы"}
-                    )
-                elif quantity > products_quantity[product_id]:
-                    raise serializers.ValidationError(
-                        {'quantity': f"Товара с id {product_id} {products_quantity[product_id]}шт"}
-                    )
-                elif quantity <= 0:
-                    raise serializers.ValidationError(
-                        {'quantity': 'Значение должно быть больше нуля.'}
-                    )
+            elif not is_integer(quantity) or quantity <= 0:
+                errors.setdefault('quantity', []).append('Значение должно быть больше нуля.')
+            elif quantity > products_quantity[product_id]:
+                errors.setdefault('quantity', []).append(f"Товара с id {product_id} {products_quantity[product_id]}шт")
+        if errors:
+            raise serializers.ValidationError(errors)
         return attrs
 
 
-class OrderDetailsSerializer(serializers.ModelSerializer):
+class OrderDetailsSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор деталей заказа'''
 
     contacts = serializers.StringRelatedField()
     ordered_items = OrderedItemsSerializer(many=True, read_only=True)
     total_price = serializers.IntegerField()
 
+    select_related = ('contacts',)
+    prefetch_related = (('ordered_items', OrderedItemsSerializer),)
+
     class Meta:
         model = Order
         fields = ('id', 'contacts', 'total_price', 'status', 'created_at', 'updated_at', 'ordered_items')
 
 
-class OrdersSerializer(serializers.ModelSerializer):
+class OrdersSerializer(QueryPlanSerializerMixin, serializers.ModelSerializer):
     total_price = serializers.IntegerField()
     contacts = serializers.StringRelatedField()
     user = serializers.StringRelatedField()
     ordered_items = serializers.StringRelatedField(many=True)
 
+    select_related = ('user', 'contacts')
+    prefetch_related = ('ordered_items__product__shop',)
+
     class Meta:
         model = Order
         fields = ('id', 'user', 'status', 'total_price', 'created_at', 'contacts', 'ordered_items')
+
+
+class PartnerOrdersSerializer(OrdersSerializer):
+    '''Заказы для магазина: сумма только по позициям магазина'''
+
+    total_price = serializers.IntegerField(source='shop_total')
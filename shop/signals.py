@@ -1,10 +1,23 @@
+from contextlib import contextmanager
+from threading import local
+
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import Signal, receiver
 
+from shop.cache import bump_on_commit
+from shop.cards import update_cards
+from shop.dictionaries import categories, parameters
+from shop.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from shop.facets import update_facet_counts, update_facets
+from shop.search import update_documents
 from users.models import User
 
 order_confirmed = Signal()
+# изменения продуктов текущего потока, которые обновятся после фиксации транзакции
+state = local()
 
 
 @receiver(order_confirmed)
@@ -33,3 +46,131 @@ def order_confirmed_signal(user, contacts, basket, **kwargs):
 
     message.send()
     message_to_admin.send()
+
+
+@receiver([post_save, post_delete], sender=Parameter)
+def clear_parameters_dictionary(instance, **kwargs):
+    parameters.invalidate()
+    if kwargs.get('created') is False:
+        product_ids = list(ProductInfo.objects.filter(
+            parameters__parameter=instance).values_list('product_id', flat=True).distinct())
+        update_cards(product_ids)
+        bump_products(product_ids)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def clear_categories_dictionary(instance, **kwargs):
+    categories.invalidate()
+    bump_on_commit('catalog', f'category:{instance.id}')
+    if kwargs.get('created') is False:
+        product_ids = list(Product.objects.filter(category=instance).values_list('id', flat=True))
+        update_cards(product_ids)
+        bump_products(product_ids)
+
+
+@receiver(pre_save, sender=Shop)
+def check_shop_cards(instance, update_fields=None, **kwargs):
+    '''
+    Статус и название магазина входят в карточки его продуктов: карточки
+    пересобираются, только если одно из этих полей действительно изменилось
+    '''
+
+    instance.cards_changed = False
+    if instance.pk is None or update_fields is not None and not {'name', 'is_open'} & set(update_fields):
+        return
+    instance.cards_changed = Shop.objects.filter(pk=instance.pk).exclude(
+        name=instance.name, is_open=instance.is_open).exists()
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def bump_shop_cache(instance, **kwargs):
+    bump_on_commit('catalog', f'shop:{instance.id}')
+    if kwargs.get('created') is False and instance.cards_changed:
+        transaction.on_commit(lambda: update_shop_cards(instance.id))
+
+
+def update_shop_cards(shop_id):
+    product_ids = list(ProductInfo.objects.filter(shop_id=shop_id).values_list('product_id', flat=True))
+    with transaction.atomic():
+        update_cards(product_ids)
+        bump_products(product_ids)
+
+
+def bump_products(product_ids, *scopes):
+    '''Ответы каталога с продуктами: списки, сами продукты, их категории и магазины'''
+
+    scopes = set(scopes)
+    for product_id, category_id, shop_id in Product.objects.filter(id__in=product_ids).values_list(
+            'id', 'category_id', 'product_infos__shop_id'):
+        scopes.update((f'product:{product_id}', f'category:{category_id}'))
+        if shop_id is not None:
+            scopes.add(f'shop:{shop_id}')
+    bump_on_commit('catalog', *scopes)
+
+
+def update_products(product_ids, *scopes):
+    update_documents(product_ids)
+    update_facet_counts(update_facets(product_ids))
+    update_cards(product_ids)
+    bump_products(product_ids, *scopes)
+
+
+@contextmanager
+def product_signals_muted():
+    '''
+    Сигналы продуктов, предложений и параметров внутри блока ничего
+    не обновляют: импорт пишет и удаляет строки пачками и обновляет
+    документы, фильтры, карточки и кеш по измененным продуктам сам.
+    '''
+
+    state.muted = getattr(state, 'muted', 0) + 1
+    try:
+        yield
+    finally:
+        state.muted -= 1
+
+
+def update_on_commit(product_ids=(), product_info_ids=(), scopes=()):
+    '''
+    Сигналы по каждой строке только собирают id, документы, фильтры,
+    карточки и версии кеша обновляются один раз после фиксации
+    транзакции: удаление магазина или сотни предложений - одно обновление.
+    '''
+
+    if getattr(state, 'muted', 0):
+        return
+    pending = getattr(state, 'pending', None)
+    if pending is None:
+        pending = state.pending = {'products': set(), 'product_infos': set(), 'scopes': set()}
+    pending['products'].update(product_ids)
+    pending['product_infos'].update(product_info_ids)
+    pending['scopes'].update(scopes)
+    # первый выполненный обработчик забирает все собранные id, остальные ничего не делают;
+    # после отката собранные id обновятся со следующей транзакцией
+    transaction.on_commit(flush_updates)
+
+
+def flush_updates():
+    pending = state.__dict__.pop('pending', None)
+    if pending is None:
+        return
+    product_ids = pending['products'] | set(ProductInfo.objects.filter(
+        id__in=pending['product_infos']).values_list('product_id', flat=True))
+    with transaction.atomic():
+        update_products(product_ids, *pending['scopes'])
+
+
+@receiver(post_save, sender=Product)
+def update_product_document(instance, **kwargs):
+    update_on_commit(product_ids=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=ProductInfo)
+def update_product_info_document(instance, **kwargs):
+    # удаленное предложение уже не найти по продукту, магазин передается явно
+    update_on_commit(product_ids=[instance.product_id], scopes=[f'shop:{instance.shop_id}'])
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def update_product_parameter_document(instance, **kwargs):
+    update_on_commit(product_info_ids=[instance.product_id])
@@ -0,0 +1,60 @@
+from hashlib import sha256
+from tempfile import TemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from requests import get
+
+from shop.models import ImportFile, ImportJob
+from shop.price_lists import detect_format
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def stage_price_list(url, user, shop=None):
+    '''
+    Скачивание прайс-листа по частям во временный файл с подсчетом
+    SHA-256 и сохранение в хранилище. Файл с таким же содержимым
+    хранится один раз. Формат определяется по расширению или Content-Type.
+    Возвращает задачу импорта, в celery
+    передается только ее id.
+    Если магазин уже импортировал прайс-лист, запрос условный
+    (If-None-Match / If-Modified-Since). Если сервер ответил 304
+    или содержимое совпало с последним импортом, возвращается None.
+    '''
+
+    headers = {}
+    if shop is not None and shop.price_list_etag:
+        headers['If-None-Match'] = shop.price_list_etag
+    if shop is not None and shop.price_list_last_modified:
+        headers['If-Modified-Since'] = shop.price_list_last_modified
+
+    digest, size = sha256(), 0
+    with TemporaryFile() as stream:
+        with get(url, headers=headers, stream=True, timeout=settings.IMPORT_TIMEOUT) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            format_ = detect_format(url, response.headers.get('Content-Type')) or 'yaml'
+            etag = response.headers.get('ETag', '')
+            last_modified = response.headers.get('Last-Modified', '')
+            for chunk in response.iter_content(CHUNK_SIZE):
+                digest.update(chunk)
+                stream.write(chunk)
+                size += len(chunk)
+
+        if shop is not None and shop.price_list_sha256 == digest.hexdigest():
+            shop.price_list_etag, shop.price_list_last_modified = etag, last_modified
+            shop.save(update_fields=['price_list_etag', 'price_list_last_modified'])
+            return None
+
+        stream.seek(0)
+        filename = url[url.rfind('/') + 1:]
+        import_file, _ = ImportFile.objects.get_or_create(
+            sha256=digest.hexdigest(),
+            defaults={'file': File(stream, name=filename), 'size': size}
+        )
+    return ImportJob.objects.create(
+        user=user, url=url, format=format_, file=import_file, etag=etag, last_modified=last_modified
+    )
@@ -0,0 +1,116 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.utils import timezone
+
+from shop.cache import bump_on_commit
+from shop.cards import update_cards
+from shop.models import Order, OrderItem, ProductInfo
+
+
+class StockReservationError(Exception):
+    '''Товаров в наличии меньше, чем в заказе; failures - позиции с нехваткой'''
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__('; '.join(
+            f"товара с id {failure['product']} в наличии {failure['available']} шт, "
+            f"в заказе {failure['requested']} шт" for failure in failures
+        ))
+
+
+def lock(product_info_ids):
+    # строки блокируются в порядке id: параллельные резервирования и возвраты не ждут друг друга по кругу
+    list(ProductInfo.objects.select_for_update().filter(id__in=product_info_ids).order_by('id').values_list('id'))
+
+
+def stock_changed(product_info_ids):
+    '''Остатки входят в карточки продуктов и закешированные ответы каталога'''
+
+    rows = list(ProductInfo.objects.filter(id__in=product_info_ids).values_list(
+        'shop_id', 'product_id', 'product__category_id'))
+    update_cards({product_id for _, product_id, _ in rows})
+    bump_on_commit('catalog', *{
+        scope for shop_id, product_id, category_id in rows
+        for scope in (f'shop:{shop_id}', f'product:{product_id}', f'category:{category_id}')
+    })
+
+
+def reserve_stock(order):
+    '''
+    Резервирование товаров заказа: остатки всех позиций уменьшаются
+    одним условным UPDATE ... SET quantity = quantity - x WHERE quantity >= x
+    в открытых магазинах. Если хотя бы одной позиции не хватает, изменения
+    откатываются и StockReservationError перечисляет все такие позиции.
+    '''
+
+    items = dict(order.ordered_items.values_list('product_id', 'quantity'))
+    try:
+        with transaction.atomic():
+            if items:
+                lock(items)
+                reserved = ProductInfo.objects.filter(
+                    reduce(or_, (Q(id=product_id, quantity__gte=quantity) for product_id, quantity in items.items())),
+                    shop__is_open=True
+                ).update(quantity=Case(
+                    *(When(id=product_id, then=F('quantity') - quantity) for product_id, quantity in items.items())
+                ))
+                if reserved != len(items):
+                    raise StockReservationError([])
+                stock_changed(items)
+            Order.objects.filter(pk=order.pk).update(stock_reserved=True)
+    except StockReservationError:
+        available = dict(ProductInfo.objects.filter(
+            id__in=items, shop__is_open=True).values_list('id', 'quantity'))
+        raise StockReservationError([
+            {'product': product_id, 'requested': quantity, 'available': available.get(product_id, 0)}
+            for product_id, quantity in items.items() if available.get(product_id, 0) < quantity
+        ])
+    order.stock_reserved = True
+
+
+def release_stock(order_ids):
+    '''
+    Возврат зарезервированных товаров заказов на склад: количество по
+    всем заказам суммируется и возвращается одним UPDATE. Возвращает
+    количество возвращенных единиц товара.
+    '''
+
+    with transaction.atomic():
+        quantities = dict(OrderItem.objects.filter(
+            order_id__in=order_ids, order__stock_reserved=True
+        ).values_list('product_id').annotate(Sum('quantity')).order_by())
+        if quantities:
+            lock(quantities)
+            ProductInfo.objects.filter(id__in=quantities).update(quantity=F('quantity') + Case(
+                *(When(id=product_id, then=quantity) for product_id, quantity in quantities.items())
+            ))
+            stock_changed(quantities)
+        Order.objects.filter(id__in=order_ids).update(stock_reserved=False)
+    return sum(quantities.values())
+
+
+def release_expired_reservations(ttl, batch_size=500):
+    '''
+    Отмена новых заказов, которые не менялись дольше ttl секунд, и возврат
+    их резерва. Заказы обрабатываются пачками от самых старых по индексу
+    (status, updated_at), заблокированные другими транзакциями пропускаются.
+    Возвращает количество отмененных заказов, возвращенных единиц и пачек.
+    '''
+
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    released = {'orders': 0, 'units': 0, 'batches': 0}
+    while True:
+        with transaction.atomic():
+            order_ids = list(Order.objects.select_for_update(skip_locked=True).filter(
+                status='new', stock_reserved=True, updated_at__lt=cutoff
+            ).order_by('updated_at').values_list('id', flat=True)[:batch_size])
+            if not order_ids:
+                return released
+            released['units'] += release_stock(order_ids)
+            Order.objects.filter(id__in=order_ids).update(status='canceled', updated_at=timezone.now())
+        released['orders'] += len(order_ids)
+        released['batches'] += 1
@@ -1,14 +1,23 @@
+from contextlib import contextmanager
+
 from django.conf import settings
-from django.core.mail import send_mail
-from django.db import transaction
+from django.core.mail import send_mail, send_mass_mail
 
-from celery import shared_task
-from django.db.models import Sum, F
+from celery import chord, shared_task
+from celery.utils.log import get_task_logger
+from django.db import OperationalError
+from django.utils import timezone
 
-from shop.models import Order, Shop, Category, ProductInfo, Product, Parameter, ProductParameter
+from shop.importer import PriceListImporter
+from shop.models import Order, Shop, ImportJob, ImportShard
+from shop.price_lists import read_price_list
+from shop.stock import release_expired_reservations
 from users.models import User, UserInfo
 
 
+logger = get_task_logger(__name__)
+
+
 @shared_task()
 def change_status_email_task(user_id, order_id, status):
 
@@ -24,19 +33,40 @@ def change_status_email_task(user_id, order_id, status):
     )
 
 
+@shared_task()
+def bulk_status_email_task(order_ids, status):
+
+    '''
+    Письма о изменении статуса пачки заказов: покупателям по письму
+    на заказ, администратору одно письмо со списком заказов.
+    Все письма отправляются через одно соединение с почтовым сервером.
+    '''
+
+    status = dict(Order.STATE_CHOICES)[status]
+    admin = User.objects.get(is_superuser=True)
+    messages = [
+        ('Обновлен статус заказа', f'Заказ № {order_id}, статус: {status}', settings.EMAIL_HOST_USER, [email])
+        for order_id, email in Order.objects.filter(id__in=order_ids).values_list('id', 'user__email')
+    ]
+    messages.append((
+        'Обновлен статус заказов',
+        f'Заказы № {", ".join(map(str, order_ids))}, статус: {status}',
+        settings.EMAIL_HOST_USER,
+        [admin.email]
+    ))
+    send_mass_mail(messages)
+
+
 @shared_task()
 def new_order_email_task(user_id, basket_id, contacts_id):
 
     '''Письмо о создании нового заказа'''
 
     user = User.objects.get(id=user_id)
-    basket = Order.objects.filter(id=basket_id).prefetch_related(
-        'ordered_items', 'ordered_items__product').annotate(
-        total_price=Sum(F('ordered_items__quantity') * F('ordered_items__product__price')
-                        )).first()
+    basket = Order.objects.filter(id=basket_id).prefetch_related('ordered_items__product').first()
     contacts = UserInfo.objects.get(id=contacts_id)
     products = [
-        f'{i + 1}. {p.product.model}, {float(p.product.price)} кол-во: {p.quantity}'
+        f'{i + 1}. {p.product.model}, {float(p.price)} кол-во: {p.quantity}'
         for i, p in enumerate(basket.ordered_items.all())
     ]
     products = '\n'.join(products)
@@ -59,13 +89,10 @@ def new_order_email_to_admin_task(user_id, basket_id, contacts_id):
 
     user = User.objects.get(id=user_id)
     admin = User.objects.get(is_superuser=True)
-    basket = Order.objects.filter(id=basket_id).prefetch_related(
-        'ordered_items', 'ordered_items__product').annotate(
-        total_price=Sum(F('ordered_items__quantity') * F('ordered_items__product__price')
-                        )).first()
+    basket = Order.objects.filter(id=basket_id).prefetch_related('ordered_items__product').first()
     contacts = UserInfo.objects.get(id=contacts_id)
     products = [
-        f'{i + 1}. {p.product.model}, {float(p.product.price)} кол-во: {p.quantity}'
+        f'{i + 1}. {p.product.model}, {float(p.price)} кол-во: {p.quantity}'
         for i, p in enumerate(basket.ordered_items.all())
     ]
     products = '\n'.join(products)
@@ -81,36 +108,91 @@ def new_order_email_to_admin_task(user_id, basket_id, contacts_id):
     )
 
 
-@shared_task()
-def do_import_task(url, user_id, data):
-    with transaction.atomic():
-        shop, created = Shop.objects.get_or_create(user_id=user_id, **data['shop'])
-        if created and (not shop.url and not shop.filename):
-            separator = url.rfind('/')
-            shop.url = url[:separator + 1]
-            shop.filename = url[separator + 1:]
-            shop.save()
-
-        categories = data.get('categories')
-        if categories:
-            for category in categories:
-                category_object, _ = Category.objects.get_or_create(id=category['id'],
-                                                                    name=category['name'])
-                category_object.shops.add(shop.id)
-                category_object.save()
-        ProductInfo.objects.filter(shop_id=shop.id).delete()
-
-        for item in data['goods']:
-            product, _ = Product.objects.get_or_create(
-                name=item['name'], category_id=item['category'], rrc=item['price_rrc']
-            )
-            product_info = ProductInfo.objects.create(
-                shop_id=shop.id, product_id=product.id, model=item['model'],
-                article=item['id'], price=item['price'], quantity=item['quantity']
-            )
-            for name, value in item['parameters'].items():
-                parameter, _ = Parameter.objects.get_or_create(name=name)
-                ProductParameter.objects.update_or_create(
-                    product_id=product_info.id, parameter_id=parameter.id,
-                    defaults={'value': value}
-                )
+@contextmanager
+def import_job_errors(job_id):
+
+    '''Отметка задачи импорта как завершенной с ошибкой'''
+
+    try:
+        yield
+    except Exception as error:
+        ImportJob.objects.filter(id=job_id).update(
+            status='failed', finished_at=timezone.now(), error=str(error)
+        )
+        raise
+
+
+@shared_task(autoretry_for=(OperationalError,), retry_backoff=True, max_retries=3)
+def do_import_task(job_id):
+
+    '''
+    Импорт прайс-листа магазина.
+    Файл читается из хранилища, куда его сохранил ImportProductsView,
+    поэтому повторный запуск задачи не скачивает файл заново.
+    Разбор потоковый (yaml, csv или jsonl), товары сохраняются частями по IMPORT_BATCH_SIZE,
+    ход импорта сохраняется в ImportJob. Если частей несколько, они
+    обрабатываются параллельно (chord из import_shard_task), затем
+    finish_import_task применяет все изменения в одной транзакции.
+    '''
+
+    job = ImportJob.objects.select_related('file').get(id=job_id)
+    ImportJob.objects.filter(id=job.id).update(
+        status='running', started_at=timezone.now(), finished_at=None, error=''
+    )
+    with import_job_errors(job.id), job.file.file.open('rb') as stream:
+        sections = read_price_list(job.format, stream, settings.IMPORT_BATCH_SIZE)
+        PriceListImporter(job, settings.IMPORT_BATCH_SIZE).stage(sections)
+
+    shards = list(job.shards.values_list('id', flat=True))
+    if settings.IMPORT_PARALLEL and len(shards) > 1:
+        chord(import_shard_task.si(shard_id) for shard_id in shards)(finish_import_task.si(job.id))
+        return {'job': job.id, 'shards': len(shards)}
+    for shard_id in shards:
+        import_shard_task(shard_id)
+    return finish_import_task(job.id)
+
+
+@shared_task(autoretry_for=(OperationalError,), retry_backoff=True, max_retries=3)
+def import_shard_task(shard_id):
+
+    '''Вычисление изменений каталога магазина для одной части импорта'''
+
+    shard = ImportShard.objects.select_related('job', 'job__shop').get(id=shard_id)
+    with import_job_errors(shard.job_id):
+        PriceListImporter(shard.job, settings.IMPORT_BATCH_SIZE).plan(shard)
+
+
+@shared_task(autoretry_for=(OperationalError,), retry_backoff=True, max_retries=3)
+def finish_import_task(job_id):
+
+    '''
+    Применение изменений всех частей импорта в одной транзакции,
+    возвращает отчет по этапам импорта. После успешного импорта
+    в магазине сохраняются хеш, ETag и Last-Modified файла.
+    '''
+
+    job = ImportJob.objects.select_related('file', 'shop').get(id=job_id)
+    with import_job_errors(job.id):
+        report = PriceListImporter(job, settings.IMPORT_BATCH_SIZE).finish()
+    Shop.objects.filter(id=report['shop']).update(
+        price_list_sha256=job.file.sha256, price_list_etag=job.etag,
+        price_list_last_modified=job.last_modified
+    )
+    ImportJob.objects.filter(id=job.id).update(
+        status='done', finished_at=timezone.now(), timings=report['timings'], counts=report['counts']
+    )
+    return report
+
+
+@shared_task(autoretry_for=(OperationalError,), retry_backoff=True, max_retries=3)
+def release_expired_reservations_task():
+
+    '''
+    Отмена новых заказов старше ORDER_RESERVATION_TTL и возврат их товаров
+    на склад, запускается celery beat. Результат - количество заказов,
+    единиц товара и пачек, оно же пишется в лог.
+    '''
+
+    released = release_expired_reservations(settings.ORDER_RESERVATION_TTL, settings.ORDER_RESERVATION_BATCH_SIZE)
+    logger.info('Резерв снят: заказов %(orders)s, единиц товара %(units)s, пачек %(batches)s', released)
+    return released
@@ -0,0 +1,14 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from shop.models import Order
+
+
+def install_order_totals(using=DEFAULT_DB_ALIAS, **kwargs):
+    '''
+    Фиксация цен и сумм заказов, подтвержденных до появления
+    Order.total_price и OrderItem.price, вызывается после migrate
+    '''
+
+    for order in Order.objects.using(using).exclude(status='basket').filter(
+            ordered_items__price__isnull=True).distinct():
+        order.freeze_prices()
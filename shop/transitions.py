@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.utils import timezone
+
+from shop.models import Order
+from shop.stock import release_stock
+from shop.tasks import bulk_status_email_task
+
+
+class TransitionError(ValueError):
+    '''Переход между статусами не поддерживается'''
+
+
+def change_status(orders, from_status, to_status, transitions=Order.TRANSITIONS):
+    '''
+    Перевод заказов выборки orders из статуса from_status в to_status
+    в одной транзакции: строки блокируются, статус меняется одним UPDATE,
+    при отмене резерв всех заказов возвращается одним UPDATE остатков.
+    Подтверждаются только заказы с резервом товаров, заказы в другом
+    статусе пропускаются. Письма об изменении статуса ставятся в очередь
+    одной задачей после фиксации транзакции. Возвращает id переведенных заказов.
+    '''
+
+    if (from_status, to_status) not in transitions:
+        raise TransitionError(f'Переход из статуса "{from_status}" в "{to_status}" не поддерживается')
+
+    with transaction.atomic():
+        selected = Order.objects.select_for_update().filter(id__in=orders.values('id'), status=from_status)
+        if to_status == 'confirmed':
+            selected = selected.filter(stock_reserved=True)
+        order_ids = list(selected.order_by('id').values_list('id', flat=True))
+        if not order_ids:
+            return []
+        if to_status == 'canceled':
+            release_stock(order_ids)
+        Order.objects.filter(id__in=order_ids).update(status=to_status, updated_at=timezone.now())
+        transaction.on_commit(lambda: bulk_status_email_task.delay(order_ids, to_status))
+    return order_ids
@@ -2,9 +2,9 @@ from django.urls import path
 from rest_framework.routers import DefaultRouter
 
 from shop.views import (
-    ImportProductsView, ProductView, ProductsView, BasketView,
+    ImportProductsView, ImportJobView, CatalogCacheStatsView, ProductView, ProductsView, BasketView,
     ConfirmOrderView, GetOrders, GetOrderDetail, GetOrUpdateStatus,
-    GetPartnerOrders, CategoriesViewSet, ShopsViewSet
+    GetPartnerOrders, PartnerOrderStatusView, CategoriesViewSet, ShopsViewSet
 )
 
 
@@ -14,12 +14,15 @@ router.register('shops', ShopsViewSet, basename='shops')
 
 urlpatterns = [
     path('partner/update/', ImportProductsView.as_view()),
+    path('partner/update/<int:pk>/', ImportJobView.as_view(), name='import-job'),
     path('partner/status/<int:pk>/', GetOrUpdateStatus.as_view(), name='partner-details'),
     path('partner/orders/', GetPartnerOrders.as_view()),
+    path('partner/orders/status/', PartnerOrderStatusView.as_view(), name='partner-orders-status'),
+    path('catalog/cache/', CatalogCacheStatsView.as_view(), name='catalog-cache'),
     path('products/', ProductsView.as_view(), name='products-list'),
     path('products/<int:pk>/', ProductView.as_view(), name='product-detail'),
-    path('basket/', BasketView.as_view()),
-    path('basket/confirm/', ConfirmOrderView.as_view()),
-    path('orders/', GetOrders.as_view()),
-    path('orders/<int:pk>/', GetOrderDetail.as_view())
+    path('basket/', BasketView.as_view(), name='basket'),
+    path('basket/confirm/', ConfirmOrderView.as_view(), name='basket-confirm'),
+    path('orders/', GetOrders.as_view(), name='orders'),
+    path('orders/<int:pk>/', GetOrderDetail.as_view(), name='order-detail')
 ] + router.urls
@@ -1,34 +1,40 @@
 
-from django.db.models import Sum, F
+from django.db import transaction
+from django.db.models import DecimalField, Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils.decorators import method_decorator
 from drf_yasg import openapi
-from requests import get
-from requests.exceptions import ConnectionError
-import yaml
-from rest_framework.filters import SearchFilter
-from yaml.scanner import ScannerError
+from requests.exceptions import RequestException
 from rest_framework import status
 from rest_framework.generics import get_object_or_404, ListAPIView, RetrieveAPIView, RetrieveUpdateAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
-from rest_framework.settings import api_settings
-from urllib3.exceptions import MaxRetryError, NewConnectionError
-from yaml.loader import SafeLoader
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 
-from shop.models import Shop, Category, Product, Order
+from shop.models import Shop, Category, Product, Order, OrderItem, ImportJob
 from shop.permissions import IsShop, IsBuyer
 from shop.serializers import (
-    URLSerializer, ShopsViewSerializer, CategoriesViewSerializer,
+    URLSerializer, PartnerOrderStatusSerializer, ImportJobSerializer, ShopsViewSerializer, CategoriesViewSerializer,
     CategoryItemsViewSerializer, ProductSerializer, ShopItemsViewSerializer,
-    ProductsViewSerializer, BasketSerializer, OrderDetailsSerializer, OrdersSerializer
+    ProductsViewSerializer, BasketSerializer, OrderDetailsSerializer, OrdersSerializer, PartnerOrdersSerializer
 )
 
-from shop.mixins import MyPaginationMixin
+from shop.cache import stats as cache_stats, validators
+from shop.mixins import (
+    CachedResponseMixin, ConditionalGetMixin, FastSerializerMixin, MyPaginationMixin, QueryPlanMixin
+)
+from shop.pagination import KeysetPagination
+from shop.price_lists import detect_format
+from shop.facets import ProductFacetFilter, facet_counts
+from shop.search import ProductSearchFilter
+from shop.staging import stage_price_list
+from shop.stock import StockReservationError, reserve_stock
 from shop.tasks import new_order_email_task, new_order_email_to_admin_task, do_import_task
+from shop.transitions import change_status
 from users.models import UserInfo
 from users.permissions import IsOwner
 from users.serializers import UserContactsViewSerializer
@@ -37,10 +43,14 @@ from users.serializers import UserContactsViewSerializer
 class ImportProductsView(APIView):
     '''
     Класс для импорта товаров магазином.
-    В post-запросе передается url с путем к yaml-файлу.
+    В post-запросе передается url с путем к файлу прайс-листа
+    в формате yaml, csv или jsonl (JSON Lines).
     При следующих импортах можно передавать в url сайт магазина,
     если параметр site передавался в yaml-файле при первом
     импорте. В таком случае путь к файлу будет прочитан из базы.
+    Формат файла без расширения определяется по Content-Type ответа.
+    Если файл не изменился с последнего успешного импорта,
+    импорт не запускается и возвращается статус "unchanged".
     '''
 
     permission_classes = (IsAuthenticated, IsShop)
@@ -50,34 +60,50 @@ class ImportProductsView(APIView):
         type=openapi.TYPE_OBJECT, properties={
             'url': openapi.Schema(
                 type=openapi.TYPE_STRING,
-                title='Путь к .yaml файлу',
+                title='Путь к .yaml, .csv или .jsonl файлу',
                 default='https://raw.githubusercontent.com/FuchkoDmitry/REST_API/master/data/shop1.yaml')
         }
-    ), responses={200: 'Данные загружены', 400: 'некорректный yaml файл | Введите корректный url'},
-        operation_description='Загрузка прайс-листа магазина. В post-запросе передается url с путем к yaml-файлу')
+    ), responses={200: 'Импорт прайс-листа запущен | unchanged',
+                  400: 'Введите корректный url | Не удалось загрузить файл'},
+        operation_description='Загрузка прайс-листа магазина. '
+                              'В post-запросе передается url с путем к yaml, csv или jsonl файлу')
     def post(self, request):
         serializer = URLSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         url = serializer.validated_data.get('url')
 
-        if not url.endswith('.yaml'):
-            shop = get_object_or_404(Shop, site=url, user=request.user)
+        shop = None
+        if detect_format(url) is None:
+            # сайт магазина или прайс-лист без расширения, формат которого определит Content-Type ответа
+            shop = Shop.objects.filter(site=url, user=request.user).first()
             if shop:
                 url = shop.url + shop.filename
-            else:
-                return Response({'url': 'Введите корректный url'},
-                                status=status.HTTP_400_BAD_REQUEST)
+        if shop is None:
+            separator = url.rfind('/')
+            shop = Shop.objects.filter(
+                user=request.user, url=url[:separator + 1], filename=url[separator + 1:]
+            ).first()
         try:
-            stream = get(url).content
-            data = yaml.load(stream, Loader=SafeLoader)
-        except (KeyError, MaxRetryError, NewConnectionError, ConnectionError, ScannerError):
-            return Response({'url': 'некорректный yaml файл'},
+            job = stage_price_list(url, request.user, shop)
+        except RequestException:
+            return Response({'url': 'Не удалось загрузить файл'},
                             status=status.HTTP_400_BAD_REQUEST)
+        if job is None:
+            return Response({'status': 'unchanged'}, status=status.HTTP_200_OK)
+        do_import_task.delay(job.id)
+
+        return Response({'status': 'Импорт прайс-листа запущен', 'job': job.id,
+                         'job_url': reverse('import-job', kwargs={'pk': job.id}, request=request)},
+                        status=status.HTTP_200_OK)
 
-        do_import_task.delay(url, request.user.id, data)
 
-        return Response({'status': 'Данные загружены'}, status=status.HTTP_200_OK)
+class ImportJobView(RetrieveAPIView):
+    '''Статус импорта товаров: прогресс, длительность этапов и скорость'''
+
+    permission_classes = [IsAuthenticated, IsShop, IsOwner]
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
 
 
 @method_decorator(name='get', decorator=swagger_auto_schema(
@@ -93,30 +119,69 @@ class GetOrUpdateStatus(RetrieveUpdateAPIView):
     serializer_class = ShopsViewSerializer
 
 
-class GetPartnerOrders(ListAPIView):
-    '''Получить заказы пользователей'''
+class GetPartnerOrders(QueryPlanMixin, ListAPIView):
+    '''
+    Получить заказы пользователей с товарами магазина.
+    Сумма заказа - только по позициям магазина, по зафиксированным ценам.
+    '''
 
     permission_classes = [IsAuthenticated, IsShop]
-    serializer_class = OrdersSerializer
+    serializer_class = PartnerOrdersSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        queryset = Order.objects.filter(ordered_items__product__shop__user=self.request.user).exclude(
-            status='basket').prefetch_related('ordered_items', 'ordered_items__product').annotate(
-            total_price=Sum(F('ordered_items__quantity') * F('ordered_items__product__price'))).distinct()
+        shop_items = OrderItem.objects.filter(order_id=OuterRef('pk'), product__shop__user=self.request.user)
+        queryset = Order.objects.filter(Exists(shop_items)).exclude(status='basket').annotate(
+            shop_total=Subquery(shop_items.values('order_id').annotate(total=Sum(
+                F('quantity') * Coalesce('price', 'product__price'), output_field=DecimalField()
+            )).values('total'))
+        )
         return queryset
 
 
+class PartnerOrderStatusView(APIView):
+    '''
+    Массовая смена статуса заказов магазином: confirmed -> assembled,
+    assembled -> sent, sent -> delivered. Меняются заказы в статусе
+    from_status, все позиции которых из магазина пользователя: заказ
+    с товарами других магазинов не может быть отправлен одним из них.
+    Остальные id возвращаются в skipped. Все заказы переводятся в одной
+    транзакции, письма покупателям отправляются одной задачей.
+    '''
+
+    permission_classes = [IsAuthenticated, IsShop]
+
+    @swagger_auto_schema(request_body=PartnerOrderStatusSerializer,
+                         responses={200: 'changed - id измененных заказов, skipped - пропущенных',
+                                    400: 'Переход не поддерживается'})
+    def post(self, request):
+        serializer = PartnerOrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order_ids = serializer.validated_data['orders']
+        items = OrderItem.objects.filter(order_id=OuterRef('pk'))
+        orders = Order.objects.filter(
+            Exists(items.filter(product__shop__user=request.user)),
+            ~Exists(items.exclude(product__shop__user=request.user)),
+            id__in=order_ids
+        )
+        changed = change_status(
+            orders, serializer.validated_data['from_status'], serializer.validated_data['status'],
+            Order.PARTNER_TRANSITIONS
+        )
+        return Response({'changed': changed, 'skipped': sorted(set(order_ids) - set(changed))})
+
+
 @method_decorator(name='list', decorator=swagger_auto_schema(
     operation_description='Список магазинов'))
 @method_decorator(name='retrieve', decorator=swagger_auto_schema(
     operation_description='Список товаров из одного магазина'))
-class ShopsViewSet(ReadOnlyModelViewSet):
+class ShopsViewSet(ConditionalGetMixin, CachedResponseMixin, FastSerializerMixin, QueryPlanMixin,
+                   ReadOnlyModelViewSet):
     '''Список магазинов и товары из одного магазина'''
 
-    def get_queryset(self):
-        if self.action == 'retrieve':
-            return Shop.objects.filter(is_open=True).prefetch_related('product_infos')
-        return Shop.objects.filter(is_open=True).all()
+    cache_scope = 'shop'
+    queryset = Shop.objects.filter(is_open=True)
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -128,13 +193,13 @@ class ShopsViewSet(ReadOnlyModelViewSet):
     operation_description='Товары, представленные в определенной категории'))
 @method_decorator(name='list', decorator=swagger_auto_schema(
     operation_description='Список категорий'))
-class CategoriesViewSet(ReadOnlyModelViewSet):
+class CategoriesViewSet(ConditionalGetMixin, CachedResponseMixin, FastSerializerMixin, QueryPlanMixin,
+                        ReadOnlyModelViewSet):
     '''Список категорий и товары определенной категории'''
 
-    def get_queryset(self):
-        if self.action == 'retrieve':
-            return Category.objects.prefetch_related('products')
-        return Category.objects.all()
+    cache_scope = 'category'
+    queryset = Category.objects.all()
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -142,23 +207,45 @@ class CategoriesViewSet(ReadOnlyModelViewSet):
         return CategoriesViewSerializer
 
 
-class ProductView(RetrieveAPIView):
+class ProductView(ConditionalGetMixin, CachedResponseMixin, FastSerializerMixin, QueryPlanMixin,
+                  RetrieveAPIView):
     '''Подробная информация о продукте'''
-    queryset = Product.objects.prefetch_related('product_infos')
+    cache_scope = 'product'
+    queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
 
-class ProductsView(ListAPIView):
+class ProductsView(ConditionalGetMixin, CachedResponseMixin, FastSerializerMixin, QueryPlanMixin,
+                   ListAPIView):
     '''
     Список всех продуктов с уточнением наличия в магазинах.
-    Возможна фильтрация по параметрам 'id', 'shops__id', 'category'
-    и поиск по параметру 'name'.
+    Возможна фильтрация по параметрам 'id', 'shops__id', 'category'.
+    Параметр 'search' - полнотекстовый поиск по названию, моделям
+    и значениям параметров, результаты сортируются по релевантности.
+    Фильтры по параметрам: param[Цвет]=красный, по цене: price_min, price_max.
+    В поле facets возвращается количество продуктов по значениям
+    параметров для найденных продуктов.
     '''
-    queryset = Product.objects.prefetch_related('shops')
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    queryset = Product.objects.all()
+    filter_backends = [DjangoFilterBackend, ProductFacetFilter, ProductSearchFilter]
     filterset_fields = ['id', 'shops__id', 'category']
-    search_fields = ['name']
     serializer_class = ProductsViewSerializer
+    pagination_class = KeysetPagination
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['facets'] = facet_counts(self.filter_queryset(self.get_queryset()))
+        return response
+
+
+class CatalogCacheStatsView(APIView):
+    '''Счетчики попаданий и промахов кеша ответов каталога'''
+
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(responses={200: 'hits, misses'})
+    def get(self, request):
+        return Response(cache_stats(), status=status.HTTP_200_OK)
 
 
 class BasketView(APIView):
@@ -173,13 +260,13 @@ class BasketView(APIView):
 
         '''Просмотреть корзину'''
 
-        basket = Order.objects.filter(
-            user=self.request.user, status='basket').prefetch_related(
-            'ordered_items').annotate(
-            total_price=Sum(F('ordered_items__quantity') * F('ordered_items__product__price'))).first()
+        basket = BasketSerializer.setup_queryset(Order.objects.filter(
+            user=self.request.user, status='basket')).first()
         if not basket:
             return Response({'basket': 'Ваша корзина пуста.'},
                             status=status.HTTP_200_OK)
+        # цены в корзине еще не зафиксированы, сумма по текущим ценам
+        basket.total_price = sum(item.quantity * item.product.price for item in basket.ordered_items.all())
         serializer = BasketSerializer(basket)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -273,7 +360,8 @@ class ConfirmOrderView(APIView):
 
     @swagger_auto_schema(request_body=UserContactsViewSerializer,
                          responses={201: "Спасибо за заказ. На вашу почту отправлено письмо с деталями",
-                                    400: "Необходимо передать контаты для доставки"})
+                                    400: "Необходимо передать контаты для доставки; "
+                                         "items - позиции, которых недостаточно в наличии"})
     def post(self, request):
         contacts = request.data
         contacts_id = contacts.pop('id', 0)
@@ -284,16 +372,28 @@ class ConfirmOrderView(APIView):
                             status=400)
         if contacts:
             serializer = UserContactsViewSerializer(data=contacts)
-            if serializer.is_valid(raise_exception=True):
-                contact = serializer.save(user=user)
-                basket.status, basket.contacts = 'new', contact
-                basket.save()
+            serializer.is_valid(raise_exception=True)
+            contact = None
         elif contacts_id:
             contact = get_object_or_404(UserInfo, id=contacts_id, user=user)
-            basket.status, basket.contacts = 'new', contact
-            basket.save()
         else:
             return Response({"Необходимо передать контаты для доставки"}, status=400)
+
+        try:
+            with transaction.atomic():
+                # повторное подтверждение той же корзины ждет окончания первого
+                basket = Order.objects.select_for_update().filter(pk=basket.pk, status='basket').first()
+                if not basket:
+                    return Response({"basket": "Сначала добавьте товары в корзину"},
+                                    status=400)
+                reserve_stock(basket)
+                if contact is None:
+                    contact = serializer.save(user=user)
+                basket.status, basket.contacts = 'new', contact
+                basket.save()
+                basket.freeze_prices()
+        except StockReservationError as error:
+            return Response({'items': error.failures, 'detail': str(error)}, status=400)
         new_order_email_task.delay(user.id, basket.id, contact.id)
         new_order_email_to_admin_task.delay(user.id, basket.id, contact.id)
         # order_confirmed.send(sender=self.__class__, user=user, basket=basket, contacts=contact)
@@ -303,28 +403,45 @@ class ConfirmOrderView(APIView):
 
 class GetOrders(APIView, MyPaginationMixin):
     """
-    Получить список заказов
+    Получить список заказов, от последних измененных к старым.
+    Страницы выбираются по курсору из ссылки next,
+    параметр status позволяет выбрать заказы с определенным статусом.
     """
 
     permission_classes = [IsAuthenticated, IsBuyer]
     serializer_class = OrdersSerializer
-    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
-
-    @swagger_auto_schema(responses={200: OrdersSerializer(many=True)})
+    pagination_class = KeysetPagination
+    ordering = ('-updated_at', '-id')
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='курсор страницы'),
+        openapi.Parameter('count', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                          description='вернуть общее количество заказов'),
+        openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='статус заказа')
+    ], responses={200: OrdersSerializer(many=True)})
     def get(self, request):
-        orders = Order.objects.filter(user=self.request.user).order_by('-updated_at').prefetch_related(
-            'ordered_items').annotate(
-            total_price=Sum(F('ordered_items__quantity') * F('ordered_items__product__price')))
+        orders = self.serializer_class.setup_queryset(Order.objects.filter(user=self.request.user))
+        if request.query_params.get('status'):
+            orders = orders.filter(status=request.query_params['status'])
         page = self.paginate_queryset(orders)
-        if page is not None:
-            serializer = self.serializer_class(orders, many=True)
-            return self.get_paginated_response(serializer.data)
+        serializer = self.serializer_class(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
-class GetOrderDetail(RetrieveAPIView):
-    '''Детали заказа'''
+class GetOrderDetail(ConditionalGetMixin, RetrieveAPIView):
+    '''
+    Детали заказа. ETag зависит от времени изменения заказа
+    и версии каталога (цены и наличие товаров в заказе).
+    '''
 
     permission_classes = [IsAuthenticated, IsOwner]
-    queryset = Order.objects.prefetch_related('ordered_items').annotate(
-        total_price=Sum(F('ordered_items__quantity') * F('ordered_items__product__price')))
+    queryset = OrderDetailsSerializer.setup_queryset(Order.objects.all())
     serializer_class = OrderDetailsSerializer
+
+    def get_validators(self, request):
+        updated_at = Order.objects.filter(
+            pk=self.kwargs['pk'], user=request.user).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None, None
+        etag, last_modified = validators(request, ['catalog'], self.kwargs['pk'], updated_at.isoformat())
+        return etag, max(last_modified, int(updated_at.timestamp()))
@@ -1,9 +1,12 @@
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from model_bakery import baker
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
+from shop.dictionaries import categories, parameters
+
 
 @pytest.fixture
 def client():
@@ -30,3 +33,16 @@ def get_token(db, create_user):
     user = create_user
     token, _ = Token.objects.get_or_create(user=user)
     return token
+
+
+@pytest.fixture(autouse=True)
+def clear_dictionaries():
+    yield
+    categories.clear()
+    parameters.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    yield
+    cache.clear()
@@ -0,0 +1,35 @@
+import pytest
+import yaml
+from django.conf import settings
+from yaml.loader import SafeLoader
+
+from shop.importer import PriceListImporter
+from shop.models import ImportFile, ImportJob
+
+
+URL = 'https://example.com/data/shop1.yaml'
+PRICE_LIST = settings.BASE_DIR / 'data' / 'shop1.yaml'
+
+
+@pytest.fixture
+def price_list():
+    with open(PRICE_LIST, 'rb') as stream:
+        return yaml.load(stream, Loader=SafeLoader)
+
+
+@pytest.fixture
+def importer(create_user):
+    import_file = ImportFile.objects.create(sha256='0' * 64, file='imports/shop1.yaml', size=0)
+
+    def factory(batch_size=1000):
+        job = ImportJob.objects.create(user=create_user, url=URL, file=import_file)
+        return PriceListImporter(job, batch_size)
+    return factory
+
+
+@pytest.fixture
+def buyer_client(client, get_token):
+    get_token.user.role = 'buyer'
+    get_token.user.save()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + get_token.key)
+    return client
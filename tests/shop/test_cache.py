@@ -0,0 +1,70 @@
+import pytest
+from django.urls import reverse
+
+from shop.cache import stats
+from shop.checks import check_shared_cache
+from shop.models import Shop, Product, ProductInfo
+
+
+@pytest.mark.django_db
+def test_anonymous_catalog_cache(client, model_factory, django_assert_num_queries):
+    '''Повторный запрос каталога отдается из кеша без запросов к базе'''
+    shop = model_factory(Shop, is_open=True)
+    url = reverse('shops-detail', kwargs={'pk': shop.id})
+
+    assert client.get(url)['X-Cache'] == 'MISS'
+    with django_assert_num_queries(0):
+        response = client.get(url)
+    assert response['X-Cache'] == 'HIT'
+    assert response.json()['name'] == shop.name
+    assert client.get(url, HTTP_ACCEPT='text/html')['X-Cache'] == 'MISS'
+    assert client.get(url, {'format': 'json'})['X-Cache'] == 'MISS'
+    assert stats() == {'hits': 1, 'misses': 3}
+
+
+@pytest.mark.django_db
+def test_shop_status_invalidates_shop(client, model_factory, django_capture_on_commit_callbacks):
+    '''Смена статуса магазина сбрасывает только его ответы'''
+    shop, other = model_factory(Shop, is_open=True, _quantity=2)
+    shop_url = reverse('shops-detail', kwargs={'pk': shop.id})
+    other_url = reverse('shops-detail', kwargs={'pk': other.id})
+    client.get(shop_url)
+    client.get(other_url)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        shop.is_open = False
+        shop.save()
+
+    assert client.get(shop_url).status_code == 404
+    assert client.get(other_url)['X-Cache'] == 'HIT'
+
+
+@pytest.mark.django_db
+def test_import_invalidates_changed_products(client, model_factory, importer, price_list,
+                                             django_capture_on_commit_callbacks):
+    '''Импорт сбрасывает ответы по измененным продуктам, остальные остаются в кеше'''
+    untouched = model_factory(Product)
+    model_factory(ProductInfo, shop=model_factory(Shop), product=untouched, price=100, quantity=1)
+    with django_capture_on_commit_callbacks(execute=True):
+        report = importer().run(price_list.items())
+    removed, kept = [product_info.product for product_info in ProductInfo.objects.filter(shop_id=report['shop'])[:2]]
+    urls = [reverse('product-detail', kwargs={'pk': product.id}) for product in (removed, kept, untouched)]
+    for url in urls:
+        client.get(url)
+
+    price_list['goods'] = [item for item in price_list['goods'] if item['name'] != removed.name]
+    with django_capture_on_commit_callbacks(execute=True):
+        importer().run(price_list.items())
+
+    assert [client.get(url)['X-Cache'] for url in urls] == ['MISS', 'HIT', 'HIT']
+
+
+def test_shared_cache_check(settings):
+    '''Без общего кеша приложение не запускается: версии каталога из celery не дошли бы до web'''
+    settings.DEBUG = False
+    assert [error.id for error in check_shared_cache(None)] == ['shop.E001']
+
+    settings.CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'
+    }}
+    assert check_shared_cache(None) == []
@@ -0,0 +1,94 @@
+import pytest
+from django.urls import reverse
+
+from shop.models import Shop, Product, ProductCard, ProductInfo, Parameter, ProductParameter
+from shop.serializers import ProductInfoSerializer
+
+
+@pytest.mark.django_db
+def test_cards_follow_import(client, importer, price_list):
+    '''Импорт обновляет карточки, детальная страница отдает те же предложения'''
+    report = importer().run(price_list.items())
+    product_info = ProductInfo.objects.filter(shop_id=report['shop']).select_related('product').first()
+
+    response_json = client.get(reverse('product-detail', kwargs={'pk': product_info.product_id})).json()
+    assert response_json['product_infos'] == [
+        ProductInfoSerializer(item).data for item in ProductInfo.objects.filter(product_id=product_info.product_id)
+    ]
+
+    item = next(item for item in price_list['goods'] if item['id'] == product_info.article)
+    item['price'] += 1000
+    importer().run(price_list.items())
+
+    card = ProductCard.objects.get(product_id=product_info.product_id)
+    assert card.min_price == card.max_price == item['price']
+    assert card.product_infos[0]['price'] == f"{item['price']}.00"
+    assert card.category_name == product_info.product.category.name
+
+
+@pytest.mark.django_db
+def test_cards_count_open_shops(client, model_factory, django_capture_on_commit_callbacks):
+    '''Цены и остаток в карточке - только по открытым магазинам'''
+    product = model_factory(Product)
+    cheap, expensive = model_factory(Shop, is_open=True, _quantity=2)
+    with django_capture_on_commit_callbacks(execute=True):
+        model_factory(ProductInfo, shop=cheap, product=product, price=100, quantity=1)
+        model_factory(ProductInfo, shop=expensive, product=product, price=300, quantity=2)
+    card = ProductCard.objects.get(product=product)
+    assert (card.min_price, card.max_price, card.quantity) == (100, 300, 3)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        cheap.is_open = False
+        cheap.save()
+
+    card.refresh_from_db()
+    assert (card.min_price, card.max_price, card.quantity) == (300, 300, 2)
+    assert sorted(card.shop_ids) == sorted([cheap.id, expensive.id])
+    response_json = client.get(reverse('products-list')).json()
+    assert response_json['results'][0]['min_price'] == '300.00'
+    assert len(response_json['results'][0]['shops']) == 2
+
+
+@pytest.mark.django_db
+def test_shop_save_without_card_fields(model_factory, monkeypatch, django_capture_on_commit_callbacks):
+    '''Сохранение магазина без смены статуса и названия карточки не пересобирает'''
+    shop = model_factory(Shop, name='Связной', is_open=True)
+    model_factory(ProductInfo, shop=shop, product=model_factory(Product))
+    updates = []
+    monkeypatch.setattr('shop.signals.update_cards', updates.append)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        shop.price_list_etag = '"v2"'
+        shop.save(update_fields=['price_list_etag', 'price_list_last_modified'])
+        shop.save()
+    assert updates == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        shop.name = 'Евросеть'
+        shop.save()
+    assert len(updates) == 1
+
+
+@pytest.mark.django_db
+def test_bulk_delete_updates_once(model_factory, monkeypatch, django_assert_max_num_queries,
+                                  django_capture_on_commit_callbacks):
+    '''Удаление многих предложений обновляет карточки и счетчики фильтров один раз после фиксации'''
+    shop = model_factory(Shop, is_open=True)
+    parameters = model_factory(Parameter, _quantity=4)
+    with django_capture_on_commit_callbacks(execute=True):
+        for _ in range(50):
+            product_info = model_factory(ProductInfo, shop=shop, product=model_factory(Product), price=1, quantity=1)
+            for parameter in parameters:
+                model_factory(ProductParameter, product=product_info, parameter=parameter)
+    refreshes = []
+    monkeypatch.setattr('shop.signals.update_facet_counts', lambda pairs: refreshes.append(pairs))
+
+    with django_assert_max_num_queries(10):
+        with django_capture_on_commit_callbacks() as callbacks:
+            ProductInfo.objects.filter(shop=shop).delete()
+    for callback in callbacks:
+        callback()
+
+    assert len(refreshes) == 1
+    assert ProductCard.objects.count() == 50
+    assert all(card.product_infos == [] and card.quantity == 0 for card in ProductCard.objects.all())
@@ -0,0 +1,78 @@
+import pytest
+from django.urls import reverse
+
+from shop.models import Shop, Product, ProductInfo, Order
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    # тесты идут с кешем в памяти процесса, валидаторы каталога строятся только по общему кешу
+    monkeypatch.setattr('shop.mixins.shared', lambda: True)
+
+
+@pytest.mark.django_db
+def test_catalog_not_modified(shared_cache, client, model_factory, django_assert_num_queries,
+                              django_capture_on_commit_callbacks):
+    '''Неизмененный каталог отдается как 304 без запросов к базе'''
+    shop = model_factory(Shop, is_open=True)
+    url = reverse('shops-detail', kwargs={'pk': shop.id})
+    response = client.get(url)
+    etag = response['ETag']
+
+    with django_assert_num_queries(0):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code == 304
+
+    with django_capture_on_commit_callbacks(execute=True):
+        shop.name = 'Связной'
+        shop.save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_catalog_modified_by_price(shared_cache, client, model_factory, django_capture_on_commit_callbacks):
+    '''Изменение цены предложения меняет ETag продукта, магазина и списка продуктов'''
+    shop = model_factory(Shop, is_open=True)
+    product_info = model_factory(ProductInfo, shop=shop, product=model_factory(Product), price=10, quantity=1)
+    urls = [reverse('product-detail', kwargs={'pk': product_info.product_id}),
+            reverse('shops-detail', kwargs={'pk': shop.id}), reverse('products-list')]
+    etags = [client.get(url)['ETag'] for url in urls]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product_info.price = 20
+        product_info.save()
+
+    for url, etag in zip(urls, etags):
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_catalog_without_shared_cache(client, model_factory):
+    '''С кешем в памяти процесса каталог отдается без ETag: версия не узнает об импорте в celery'''
+    shop = model_factory(Shop, is_open=True)
+    response = client.get(reverse('shops-detail', kwargs={'pk': shop.id}), HTTP_IF_NONE_MATCH='*')
+
+    assert response.status_code == 200
+    assert 'ETag' not in response
+
+
+@pytest.mark.django_db
+def test_order_not_modified(client, get_token, model_factory):
+    '''ETag заказа меняется вместе с заказом и не раскрывается чужим пользователям'''
+    get_token.user.role = 'buyer'
+    get_token.user.save()
+    order = model_factory(Order, user=get_token.user, status='new')
+    url = reverse('order-detail', kwargs={'pk': order.id})
+    client.credentials(HTTP_AUTHORIZATION='Token ' + get_token.key)
+    etag = client.get(url)['ETag']
+
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    order.status = 'sent'
+    order.save()
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    other = model_factory(Order, status='new')
+    assert client.get(reverse('order-detail', kwargs={'pk': other.id}), HTTP_IF_NONE_MATCH='*').status_code == 403
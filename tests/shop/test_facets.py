@@ -0,0 +1,63 @@
+import pytest
+from django.urls import reverse
+
+from shop.facets import update_facet_counts, update_facets
+from shop.models import Shop, Product, ProductInfo, Parameter, ProductParameter, FacetCount
+
+
+def get_products(client, params):
+    response = client.get(reverse('products-list'), params)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.django_db
+def test_facets_without_filters(client, importer, price_list):
+    '''Без фильтров счетчики берутся из таблицы, пересчитанной после импорта'''
+    importer().run(price_list.items())
+
+    facets = get_products(client, {})['facets']
+
+    colors = [item['parameters']['Цвет'] for item in price_list['goods']]
+    assert facets['Цвет'] == {color: colors.count(color) for color in colors}
+    assert sum(facets['Встроенная память (Гб)'].values()) == len(price_list['goods'])
+
+
+@pytest.mark.django_db
+def test_filter_by_parameters_and_price(client, importer, price_list):
+    importer().run(price_list.items())
+
+    response_json = get_products(client, {'param[Встроенная память (Гб)]': '256', 'count': 'true'})
+    assert {product['name'] for product in response_json['results']} == {
+        item['name'] for item in price_list['goods'] if item['parameters']['Встроенная память (Гб)'] == 256
+    }
+    assert response_json['facets']['Встроенная память (Гб)'] == {'256': response_json['count']}
+
+    response_json = get_products(client, {'param[Цвет]': ['красный', 'черный'], 'price_max': 67000})
+    assert [product['name'] for product in response_json['results']] == ['Смартфон Apple iPhone XR 256GB (красный)']
+
+    assert get_products(client, {'param[Вес]': '1', 'count': 'true'})['count'] == 0
+    assert client.get(reverse('products-list'), {'price_min': 'abc'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_update_facets_incrementally(model_factory, django_assert_max_num_queries):
+    '''Пересчитываются только изменившиеся пары, пары без продуктов удаляются'''
+    color, memory = model_factory(Parameter, _quantity=2)
+    products = model_factory(Product, _quantity=2)
+    infos = [model_factory(ProductInfo, product=product, shop=model_factory(Shop)) for product in products]
+    for info, value in zip(infos, ('красный', 'черный')):
+        model_factory(ProductParameter, product=info, parameter=color, value=value)
+    model_factory(ProductParameter, product=infos[0], parameter=memory, value='256')
+    update_facet_counts(update_facets(product.id for product in products))
+    counts = FacetCount.objects.values_list('parameter_id', 'value', 'products')
+    assert set(counts.all()) == {(color.id, 'красный', 1), (color.id, 'черный', 1), (memory.id, '256', 1)}
+
+    ProductParameter.objects.filter(product=infos[1], parameter=color).update(value='красный')
+    with django_assert_max_num_queries(10):
+        pairs = update_facets([products[1].id])
+        update_facet_counts(pairs)
+
+    assert pairs == {(color.id, 'красный'), (color.id, 'черный')}
+    assert set(counts.all()) == {(color.id, 'красный', 2), (memory.id, '256', 1)}
+    assert update_facets([products[1].id]) == set()
@@ -0,0 +1,51 @@
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from shop.models import Product, ProductCard, ProductInfo
+
+
+def get_content(client, settings, url, params, fast):
+    settings.CATALOG_FAST_SERIALIZERS = fast
+    response = client.get(url, params)
+    # ответ не из кеша каталога, счетчик запросов throttling сбрасывается
+    cache.clear()
+    assert response.status_code == 200
+    return response.content
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('endpoint, params', [
+    ('shops-detail', {}), ('categories-detail', {}), ('product-detail', {}),
+    ('products-list', {'page_size': 3}), ('products-list', {'search': 'Apple', 'page_size': 2}),
+])
+def test_fast_serializers_same_response(client, settings, importer, price_list, endpoint, params):
+    '''Ответы каталога побайтно совпадают с ответами сериализаторов DRF, включая следующую страницу'''
+    report = importer().run(price_list.items())
+    product_info = ProductInfo.objects.filter(shop_id=report['shop']).select_related('product').first()
+    pk = {
+        'shops-detail': report['shop'], 'categories-detail': product_info.product.category_id,
+        'product-detail': product_info.product_id,
+    }.get(endpoint)
+    url = reverse(endpoint, kwargs={'pk': pk} if pk else None)
+
+    content = get_content(client, settings, url, params, fast=True)
+    assert content == get_content(client, settings, url, params, fast=False)
+
+    if endpoint == 'products-list':
+        next_url = client.get(url, params).json()['next']
+        cache.clear()
+        assert next_url
+        assert get_content(client, settings, next_url, {}, True) == get_content(client, settings, next_url, {}, False)
+
+
+@pytest.mark.django_db
+def test_fast_serializers_product_without_offers(client, settings, model_factory):
+    '''Продукт без предложений и без карточки: те же null, что у сериализатора DRF'''
+    product = model_factory(Product)
+    url = reverse('product-detail', kwargs={'pk': product.pk})
+
+    assert get_content(client, settings, url, {}, True) == get_content(client, settings, url, {}, False)
+    ProductCard.objects.filter(product=product).delete()
+    url = reverse('products-list')
+    assert get_content(client, settings, url, {}, True) == get_content(client, settings, url, {}, False)
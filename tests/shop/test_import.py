@@ -0,0 +1,351 @@
+import copy
+import csv
+import json
+from io import BytesIO, StringIO
+
+import pytest
+from django.conf import settings
+from django.urls import reverse
+
+from shop.dictionaries import ReferenceDictionary, parameters
+from shop.importer import PriceListImporter
+from shop.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, ImportJob
+from shop.price_lists import detect_format, read_price_list, read_yaml
+from shop.staging import stage_price_list
+from shop.tasks import do_import_task, import_shard_task, finish_import_task
+
+
+URL = 'https://example.com/data/shop1.yaml'
+PRICE_LIST = settings.BASE_DIR / 'data' / 'shop1.yaml'
+
+
+def test_read_yaml_in_batches(price_list):
+    '''Потоковое чтение отдает те же данные, товары - пачками'''
+    with open(PRICE_LIST, 'rb') as stream:
+        sections = list(read_yaml(stream, batch_size=2))
+
+    goods = [batch for section, batch in sections if section == 'goods']
+    assert dict(sections[:2]) == {'shop': price_list['shop'], 'categories': price_list['categories']}
+    assert all(len(batch) <= 2 for batch in goods)
+    assert [item for batch in goods for item in batch] == price_list['goods']
+
+
+@pytest.mark.django_db
+def test_import_streamed_price_list(importer, price_list):
+    with open(PRICE_LIST, 'rb') as stream:
+        report = importer(batch_size=3).run(read_yaml(stream, batch_size=3))
+
+    assert report['counts']['inserted'] == len(price_list['goods'])
+
+
+@pytest.mark.django_db
+def test_import_price_list(importer, price_list):
+    '''Импорт создает магазин, категории, товары и параметры'''
+    report = importer().run(price_list.items())
+
+    goods = price_list['goods']
+    assert ProductInfo.objects.filter(shop_id=report['shop']).count() == len(goods)
+    assert Category.objects.filter(shops=report['shop']).count() == len(price_list['categories'])
+    assert ProductParameter.objects.count() == sum(len(item['parameters']) for item in goods)
+    assert report['counts']['inserted'] == len(goods)
+    assert set(report['timings']) >= {'shop', 'categories', 'products', 'parameters', 'product_infos'}
+
+
+@pytest.mark.django_db
+def test_reimport_reuses_dictionaries(importer, price_list):
+    '''Повторный импорт не создает дубликатов продуктов и параметров'''
+    importer().run(price_list.items())
+    products, parameters = Product.objects.count(), Parameter.objects.count()
+
+    report = importer().run(price_list.items())
+
+    assert Product.objects.count() == products
+    assert Parameter.objects.count() == parameters
+    assert report['counts']['products_created'] == 0
+    assert report['counts']['parameters_created'] == 0
+
+
+@pytest.mark.django_db
+def test_reimport_applies_diff(importer, price_list):
+    '''Повторный импорт обновляет только изменившиеся позиции и удаляет исчезнувшие'''
+    importer().run(price_list.items())
+    kept = ProductInfo.objects.get(article=price_list['goods'][1]['id'])
+
+    changed, removed = price_list['goods'][0], price_list['goods'].pop()
+    changed['price'] += 100
+    changed['parameters']['Цвет'] = 'черный'
+    report = importer().run(price_list.items())
+
+    assert report['counts']['inserted'] == 0
+    assert report['counts']['updated'] == 1
+    assert report['counts']['deleted'] == 1
+    assert report['counts']['unchanged'] == len(price_list['goods']) - 1
+    assert ProductInfo.objects.filter(id=kept.id).exists()
+    assert not ProductInfo.objects.filter(article=removed['id']).exists()
+    product_info = ProductInfo.objects.get(article=changed['id'])
+    assert product_info.price == changed['price']
+    assert product_info.parameters.get(parameter__name='Цвет').value == 'черный'
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+
+@pytest.mark.django_db
+def test_stage_price_list_once(create_user, settings, tmp_path, monkeypatch):
+    '''Одинаковые файлы сохраняются один раз, задача хранит ссылку на файл'''
+    settings.MEDIA_ROOT = tmp_path
+    content = PRICE_LIST.read_bytes()
+    monkeypatch.setattr('shop.staging.get', lambda *args, **kwargs: FakeResponse(content))
+
+    first = stage_price_list(URL, create_user)
+    second = stage_price_list(URL, create_user)
+
+    assert first.id != second.id
+    assert first.file_id == second.file_id
+    assert first.file.size == len(content)
+    with second.file.file.open('rb') as stream:
+        assert stream.read() == content
+
+
+@pytest.mark.django_db
+def test_stage_unchanged_price_list(create_user, settings, tmp_path, monkeypatch):
+    '''Файл, совпадающий с последним импортом, не сохраняется и не импортируется'''
+    settings.MEDIA_ROOT = tmp_path
+    content = PRICE_LIST.read_bytes()
+    requests = []
+
+    def fake_get(url, headers, **kwargs):
+        requests.append(headers)
+        if headers.get('If-None-Match') == '"v1"':
+            return FakeResponse(b'', status_code=304)
+        return FakeResponse(content, headers={'ETag': '"v1"'})
+
+    monkeypatch.setattr('shop.staging.get', fake_get)
+    job = stage_price_list(URL, create_user)
+    shop = Shop.objects.create(
+        user=create_user, name='МТС', price_list_sha256=job.file.sha256
+    )
+
+    assert stage_price_list(URL, create_user, shop) is None
+    shop.refresh_from_db()
+    assert shop.price_list_etag == '"v1"'
+    assert stage_price_list(URL, create_user, shop) is None
+    assert requests[-1] == {'If-None-Match': '"v1"'}
+
+
+@pytest.mark.django_db
+def test_import_job_progress(client, get_token, price_list, settings, tmp_path, monkeypatch):
+    '''Задача импорта сохраняет статус, прогресс и длительность этапов'''
+    settings.MEDIA_ROOT = tmp_path
+    settings.IMPORT_BATCH_SIZE = 2
+    settings.IMPORT_PARALLEL = False
+    user = get_token.user
+    user.role = 'shop'
+    user.save()
+    monkeypatch.setattr('shop.staging.get', lambda *args, **kwargs: FakeResponse(PRICE_LIST.read_bytes()))
+    job = stage_price_list(URL, user)
+
+    report = do_import_task(job.id)
+
+    client.credentials(HTTP_AUTHORIZATION='Token ' + get_token.key)
+    response = client.get(reverse('import-job', kwargs={'pk': job.id}))
+    response_json = response.json()
+    assert response.status_code == 200
+    assert response_json['status'] == 'done'
+    assert response_json['rows_processed'] == report['rows'] == len(price_list['goods'])
+    assert response_json['counts']['inserted'] == len(price_list['goods'])
+    assert 'product_infos' in response_json['timings']
+    assert response_json['rows_per_second'] is None or response_json['rows_per_second'] > 0
+
+
+@pytest.mark.django_db
+def test_overlapping_imports(importer, price_list):
+    '''Импорт, спланированный до применения другого импорта магазина, пересчитывает план'''
+    importer().run(price_list.items())
+    full = importer()
+    full.stage(copy.deepcopy(price_list).items())
+    for shard in full.job.shards.all():
+        PriceListImporter(full.job).plan(shard)
+
+    removed = price_list['goods'].pop()
+    importer().run(price_list.items())
+    assert not ProductInfo.objects.filter(article=removed['id']).exists()
+
+    report = full.finish()
+
+    assert report['counts']['shards_replanned'] == 1
+    assert report['counts']['inserted'] == 1
+    assert ProductInfo.objects.filter(article=removed['id']).exists()
+    assert ProductInfo.objects.count() == len(price_list['goods']) + 1
+
+
+@pytest.mark.django_db
+def test_sharded_import_applies_atomically(importer, price_list):
+    '''Части обрабатываются независимо, изменения видны только после finish'''
+    importer().run(price_list.items())
+    price_list['goods'][0]['price'] += 100
+    price_list['goods'].pop()
+    job = importer(batch_size=2).job
+
+    assert PriceListImporter(job, 2).stage(price_list.items()) == 2
+    for shard in job.shards.all():
+        import_shard_task(shard.id)
+    assert ProductInfo.objects.count() == len(price_list['goods']) + 1
+
+    report = finish_import_task(job.id)
+
+    assert report['counts']['updated'] == 1
+    assert report['counts']['deleted'] == 1
+    assert ProductInfo.objects.count() == len(price_list['goods'])
+    assert not job.shards.exists()
+    job.refresh_from_db()
+    assert job.status == 'done'
+
+
+@pytest.mark.django_db
+def test_parameters_dictionary(django_assert_num_queries):
+    '''Справочник параметров отвечает из памяти и сбрасывается при изменении параметров'''
+    color = Parameter.objects.create(name='Цвет')
+    assert parameters.get_ids(['Цвет']) == {'Цвет': color.id}
+
+    with django_assert_num_queries(0):
+        assert parameters.get_name(color.id) == 'Цвет'
+
+    color.name = 'Цвет корпуса'
+    color.save()
+    assert parameters.get_name(color.id) == 'Цвет корпуса'
+
+
+@pytest.mark.django_db
+def test_parameters_dictionary_other_process(django_capture_on_commit_callbacks):
+    '''Справочник другого процесса перечитывается по версии в общем кеше'''
+    color = Parameter.objects.create(name='Цвет')
+    worker = ReferenceDictionary(Parameter)
+    # версия сверяется при каждом обращении
+    worker.version_ttl = 0
+    assert worker.get_ids(['Цвет']) == {'Цвет': color.id}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        color.name = 'Цвет корпуса'
+        color.save()
+    assert worker.get_name(color.id) == 'Цвет корпуса'
+
+    with django_capture_on_commit_callbacks(execute=True):
+        color.delete()
+    assert worker.get_ids(['Цвет корпуса']) == {}
+
+
+@pytest.mark.django_db
+def test_parameters_dictionary_version_checks(monkeypatch):
+    '''Версия справочника в общем кеше сверяется раз в version_ttl, а не на каждую строку ответа'''
+    color = Parameter.objects.create(name='Цвет')
+    lookups = []
+    monkeypatch.setattr('shop.dictionaries.versions', lambda scopes: lookups.append(scopes) or ['1'])
+    worker = ReferenceDictionary(Parameter)
+
+    for _ in range(250):
+        assert worker.get_name(color.id) == 'Цвет'
+
+    assert len(lookups) == 1
+    worker.checked_at -= worker.version_ttl
+    worker.get_name(color.id)
+    assert len(lookups) == 2
+
+
+def to_jsonl(price_list):
+    lines = [{'shop': price_list['shop']}, {'categories': price_list['categories']}, *price_list['goods']]
+    return '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines).encode()
+
+
+def to_csv(price_list):
+    categories = {category['id']: category['name'] for category in price_list['categories']}
+    parameters = list(dict.fromkeys(name for item in price_list['goods'] for name in item['parameters']))
+    stream = StringIO()
+    writer = csv.writer(stream)
+    writer.writerow(['shop', 'category', 'category_name', 'id', 'model', 'name', 'price', 'price_rrc',
+                     'quantity', *parameters])
+    for item in price_list['goods']:
+        writer.writerow([
+            price_list['shop']['name'], item['category'], categories[item['category']], item['id'],
+            item['model'], item['name'], item['price'], item['price_rrc'], item['quantity'],
+            *[item['parameters'].get(name, '') for name in parameters]
+        ])
+    return stream.getvalue().encode()
+
+
+@pytest.mark.parametrize('format_, convert', [('jsonl', to_jsonl), ('csv', to_csv)])
+def test_read_other_formats(price_list, format_, convert):
+    '''csv и jsonl читаются в те же разделы, что и yaml'''
+    sections = list(read_price_list(format_, BytesIO(convert(price_list)), batch_size=3))
+
+    goods = [item for section, batch in sections if section == 'goods' for item in batch]
+    categories = [item for section, batch in sections if section == 'categories' for item in batch]
+    assert sections[0] == ('shop', {'name': price_list['shop']['name']})
+    names = {category['id']: category['name'] for category in price_list['categories']}
+    assert {item['category'] for item in goods} <= {category['id'] for category in categories}
+    assert all(names[category['id']] == category['name'] for category in categories)
+    assert [item['id'] for item in goods] == [item['id'] for item in price_list['goods']]
+    assert [str(item['price']) for item in goods] == [str(item['price']) for item in price_list['goods']]
+    assert [item['parameters'] for item in goods] == [
+        {name: str(value) if format_ == 'csv' else value for name, value in item['parameters'].items()}
+        for item in price_list['goods']
+    ]
+
+
+def test_detect_format():
+    assert detect_format('https://example.com/shop.yml') == 'yaml'
+    assert detect_format('https://example.com/shop.CSV') == 'csv'
+    assert detect_format('https://example.com/price', 'application/x-ndjson; charset=utf-8') == 'jsonl'
+    assert detect_format('https://example.com/') is None
+
+
+@pytest.mark.django_db
+def test_import_csv_price_list(create_user, price_list, settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = tmp_path
+    content = to_csv(price_list)
+    monkeypatch.setattr('shop.staging.get', lambda *args, **kwargs: FakeResponse(content))
+    job = stage_price_list('https://example.com/data/shop1.csv', create_user)
+
+    report = do_import_task(job.id)
+
+    assert job.format == 'csv'
+    assert report['counts']['inserted'] == len(price_list['goods'])
+    assert ProductParameter.objects.count() == sum(len(item['parameters']) for item in price_list['goods'])
+
+
+@pytest.mark.django_db
+def test_import_url_without_extension(client, get_token, price_list, settings, tmp_path, monkeypatch):
+    '''Адрес без расширения, не совпадающий с сайтом магазина, - прайс-лист в формате из Content-Type'''
+    settings.MEDIA_ROOT = tmp_path
+    get_token.user.role = 'shop'
+    get_token.user.save()
+    content = to_csv(price_list)
+    monkeypatch.setattr('shop.staging.get', lambda *args, **kwargs: FakeResponse(
+        content, headers={'Content-Type': 'text/csv; charset=utf-8'}
+    ))
+    queued = []
+    monkeypatch.setattr('shop.views.do_import_task.delay', queued.append)
+    client.credentials(HTTP_AUTHORIZATION='Token ' + get_token.key)
+
+    response = client.post('/api/v1/partner/update/', {'url': 'https://example.com/export/price'})
+
+    assert response.status_code == 200
+    assert queued == [response.json()['job']]
+    assert ImportJob.objects.get(id=queued[0]).format == 'csv'
@@ -0,0 +1,146 @@
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from shop.models import Shop, Product, Order, OrderItem, ProductInfo
+
+
+@pytest.mark.django_db
+def test_orders_keyset_pagination(buyer_client, get_token, model_factory, django_assert_max_num_queries):
+    '''Заказы выдаются страницами по курсору, без пропусков и повторов при одинаковом updated_at'''
+    user = get_token.user
+    orders = model_factory(Order, user=user, status='new', _quantity=5)
+    product_info = model_factory(
+        ProductInfo, shop=model_factory(Shop), product=model_factory(Product), price=10, quantity=5
+    )
+    for order in orders:
+        model_factory(OrderItem, order=order, product=product_info, quantity=2)
+        order.freeze_prices()
+    Order.objects.filter(id__in=[order.id for order in orders[:3]]).update(updated_at=timezone.now())
+    model_factory(Order, status='new')
+
+    url, received = reverse('orders') + '?page_size=2', []
+    while url:
+        with django_assert_max_num_queries(8):
+            response = buyer_client.get(url)
+        assert response.status_code == 200
+        assert len(response.json()['results']) <= 2
+        received.extend(response.json()['results'])
+        url = response.json()['next']
+
+    expected = Order.objects.filter(user=user).order_by('-updated_at', '-id')
+    assert [order['id'] for order in received] == [order.id for order in expected]
+    assert all(order['total_price'] == 20 for order in received)
+
+
+@pytest.mark.django_db
+def test_orders_status_filter_and_invalid_cursor(buyer_client, get_token, model_factory):
+    model_factory(Order, user=get_token.user, status='basket')
+    model_factory(Order, user=get_token.user, status='sent')
+
+    response = buyer_client.get(reverse('orders'), {'status': 'sent'})
+
+    assert [order['status'] for order in response.json()['results']] == ['sent']
+    assert buyer_client.get(reverse('orders'), {'cursor': 'abc'}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_order_total_frozen_after_price_change(buyer_client, get_token, model_factory):
+    '''Цены позиций фиксируются при подтверждении, переоценка не меняет сумму заказа'''
+    product_info = model_factory(
+        ProductInfo, shop=model_factory(Shop), product=model_factory(Product), price=10, quantity=5
+    )
+    buyer_client.post(reverse('basket'), {'items': [{'product': product_info.id, 'quantity': 3}]}, format='json')
+    basket = Order.objects.get(user=get_token.user, status='basket')
+    assert basket.total_price == 30
+
+    ProductInfo.objects.filter(id=product_info.id).update(price=12)
+    assert buyer_client.get(reverse('basket')).json()['total_price'] == 36
+
+    basket.status = 'new'
+    basket.save()
+    basket.freeze_prices()
+    ProductInfo.objects.filter(id=product_info.id).update(price=20)
+
+    response = buyer_client.get(reverse('order-detail', args=[basket.id]))
+    assert response.json()['total_price'] == 36
+    assert response.json()['ordered_items'][0]['price'] == '12.00'
+
+
+@pytest.mark.django_db
+def test_basket_validation_reports_all_items(buyer_client, model_factory):
+    '''Проверяются только переданные товары, ошибки возвращаются по всем позициям'''
+    shop, closed_shop = model_factory(Shop), model_factory(Shop, is_open=False)
+    product_info = model_factory(ProductInfo, id=1, shop=shop, product=model_factory(Product), price=10, quantity=2)
+    closed = model_factory(ProductInfo, shop=closed_shop, product=model_factory(Product), price=10, quantity=2)
+    items = [
+        {'product': product_info.id, 'quantity': 5}, {'product': closed.id, 'quantity': 1},
+        {'product': 'abc', 'quantity': 1}, {'product': product_info.id, 'quantity': 0}, {'product': product_info.id},
+        {'product': [1], 'quantity': 1}, {'product': True, 'quantity': 1},
+        {'product': product_info.id, 'quantity': True},
+    ]
+
+    response = buyer_client.post(reverse('basket'), {'items': items}, format='json')
+
+    assert response.status_code == 400
+    assert response.json() == {
+        'quantity': [
+            f'Товара с id {product_info.id} 2шт', 'Значение должно быть больше нуля.',
+            'Значение должно быть больше нуля.',
+        ],
+        'product': [
+            f'Продукта с id {closed.id} не существует или магазин не принимает заказы',
+            'Продукта с id abc не существует или магазин не принимает заказы',
+            'Продукта с id [1] не существует или магазин не принимает заказы',
+            'Продукта с id True не существует или магазин не принимает заказы',
+        ],
+        'fields': ['поля для передачи: "product", "quantity"'],
+    }
+    assert not Order.objects.filter(status='basket').exists()
+
+
+@pytest.mark.django_db
+def test_basket_bulk_writes(buyer_client, get_token, model_factory, django_assert_max_num_queries):
+    '''Позиции корзины пишутся одним запросом, число запросов не зависит от числа позиций'''
+    shop = model_factory(Shop)
+    product_infos = [
+        model_factory(ProductInfo, shop=shop, product=model_factory(Product), price=10, quantity=5)
+        for _ in range(20)
+    ]
+    items = [{'product': product_info.id, 'quantity': 1} for product_info in product_infos]
+
+    with django_assert_max_num_queries(12):
+        assert buyer_client.post(reverse('basket'), {'items': items}, format='json').status_code == 200
+    with django_assert_max_num_queries(12):
+        buyer_client.post(reverse('basket'), {'items': items[:2] + [{**items[0], 'quantity': 3}]}, format='json')
+    basket = Order.objects.get(user=get_token.user, status='basket')
+    assert basket.ordered_items.count() == 20
+    assert basket.ordered_items.get(product=product_infos[0]).quantity == 3
+
+    with django_assert_max_num_queries(12):
+        buyer_client.put(reverse('basket'), {'items': [{'product': product_infos[5].id, 'quantity': 2}]}, format='json')
+    assert list(basket.ordered_items.values_list('product_id', 'quantity')) == [(product_infos[5].id, 2)]
+    basket.refresh_from_db()
+    assert basket.total_price == 20
+
+
+@pytest.mark.django_db
+def test_partner_orders_shop_total(client, get_token, model_factory):
+    '''Магазин видит сумму только своих позиций заказа по зафиксированным ценам'''
+    get_token.user.role = 'shop'
+    get_token.user.save()
+    own = model_factory(ProductInfo, shop=model_factory(Shop, user=get_token.user),
+                        product=model_factory(Product), price=10, quantity=5)
+    other = model_factory(ProductInfo, shop=model_factory(Shop), product=model_factory(Product), price=100, quantity=5)
+    order = model_factory(Order, status='new')
+    model_factory(OrderItem, order=order, product=own, quantity=2)
+    model_factory(OrderItem, order=order, product=other, quantity=1)
+    order.freeze_prices()
+    ProductInfo.objects.filter(pk=own.pk).update(price=50)
+    client.credentials(HTTP_AUTHORIZATION='Token ' + get_token.key)
+
+    response = client.get('/api/v1/partner/orders/')
+
+    assert response.status_code == 200
+    assert [(row['id'], row['total_price']) for row in response.json()['results']] == [(order.id, 20)]
+    assert Order.objects.get(pk=order.pk).total_price == 120
@@ -0,0 +1,66 @@
+import json
+from base64 import urlsafe_b64encode
+
+import pytest
+from django.urls import reverse
+
+from shop.models import Category, Product, Order
+
+
+def get_pages(client, url, params):
+    '''Все страницы списка по ссылкам next'''
+    results, response = [], client.get(url, params)
+    while True:
+        assert response.status_code == 200
+        results.extend(response.json()['results'])
+        if not response.json()['next']:
+            return results
+        response = client.get(response.json()['next'])
+
+
+@pytest.mark.django_db
+def test_products_keyset_pages(client, model_factory):
+    '''Продукты с одинаковыми названиями выдаются по (name, id) без пропусков и повторов'''
+    category = model_factory(Category)
+    products = [
+        model_factory(Product, name=name, category=category) for name in ['Б', 'А', 'Б', 'В', 'А', 'Б', 'Г']
+    ]
+
+    response = client.get(reverse('products-list'), {'page_size': 3})
+    assert 'count' not in response.json()
+    results = get_pages(client, reverse('products-list'), {'page_size': 3})
+
+    expected = sorted(products, key=lambda product: (product.name, product.id))
+    assert [product['name'] for product in results] == [product.name for product in expected]
+    assert len({product['id'] for product in results}) == len(products)
+
+
+@pytest.mark.django_db
+def test_count_on_request(client, model_factory):
+    model_factory(Category, _quantity=3)
+
+    response = client.get(reverse('categories-list'), {'count': 'true', 'page_size': 2})
+
+    assert response.json()['count'] == 3
+    assert len(response.json()['results']) == 2
+    assert client.get(reverse('categories-list'), {'cursor': 'WzFd'}).status_code == 404
+
+
+def encode(values):
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url, cursor', [
+    ('orders', ['abc', 1]),
+    ('orders', [{'a': 1}, 1]),
+    ('orders', [None, 1]),
+    ('categories-list', ['a', 'x']),
+    ('categories-list', ['a', [1]]),
+])
+def test_invalid_cursor_values(buyer_client, get_token, model_factory, url, cursor):
+    '''Курсор с значениями не того типа - 404, а не ошибка сервера'''
+    model_factory(Order, user=get_token.user, status='new')
+    model_factory(Category)
+
+    assert buyer_client.get(reverse(url), {'cursor': encode(cursor)}).status_code == 404
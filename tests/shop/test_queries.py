@@ -0,0 +1,48 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from shop.dictionaries import categories, parameters
+from shop.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+
+
+def make_catalog(model_factory, size):
+    shops = model_factory(Shop, _quantity=2)
+    category = model_factory(Category)
+    parameters = model_factory(Parameter, _quantity=2)
+    product = model_factory(Product, category=category)
+    for number in range(size):
+        item = model_factory(Product, category=category) if number else product
+        for shop in shops:
+            product_info = model_factory(ProductInfo, shop=shop, product=item, price=100, quantity=1)
+            for parameter in parameters:
+                model_factory(ProductParameter, product=product_info, parameter=parameter)
+    return shops[0], category, product
+
+
+def count_queries(client, url):
+    cache.clear()
+    # версии справочников в очищенном кеше создаются заново, справочники перечитываются до замера
+    categories.load()
+    parameters.load()
+    with CaptureQueriesContext(connection) as context:
+        assert client.get(url).status_code == 200
+    return len(context.captured_queries)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('endpoint, expected', [
+    ('shops-detail', 3), ('categories-detail', 2), ('product-detail', 1), ('products-list', 2)
+])
+def test_catalog_query_count(client, model_factory, endpoint, expected):
+    '''Количество запросов к каталогу не зависит от количества товаров'''
+    counts = []
+    for size in (1, 10):
+        shop, category, product = make_catalog(model_factory, size)
+        pk = {'shops-detail': shop.id, 'categories-detail': category.id, 'product-detail': product.id}
+        url = reverse(endpoint, kwargs={'pk': pk[endpoint]} if endpoint in pk else None)
+        counts.append(count_queries(client, url))
+
+    assert counts == [expected, expected]
@@ -0,0 +1,57 @@
+import io
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from shop.models import Shop
+from shop import renderers
+from shop.renderers import FastJSONParser, FastJSONRenderer
+
+
+@pytest.fixture(params=['orjson', 'ujson'])
+def backend(request, monkeypatch):
+    '''Проверка каждой установленной библиотеки'''
+    module = getattr(renderers, request.param)
+    if module is None:
+        pytest.skip(f'{request.param} не установлен')
+    monkeypatch.setattr(renderers, 'backend', request.param)
+    monkeypatch.setattr(renderers, 'fast_dumps', getattr(renderers, f'dumps_{request.param}'))
+    monkeypatch.setattr(renderers, 'fast_loads', module.loads)
+
+
+def test_renderer_matches_drf(backend):
+    '''Ответ побайтно совпадает с JSONRenderer, включая Decimal, даты и \\u2028'''
+    data = {
+        'price': Decimal('1999.90'), 'updated_at': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+        'name': 'Смартфон "Apple"/iPhone\u2028', 'status': gettext_lazy('basket'),
+        'items': [{'id': 1, 'quantity': None, 'is_open': True}], 'ids': (1, 2),
+    }
+
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+    assert FastJSONRenderer().render(data, 'application/json; indent=4') == \
+        JSONRenderer().render(data, 'application/json; indent=4')
+
+
+def test_parser(backend):
+    content = '{"items": [{"product": 1, "quantity": 2.5}], "name": "Чехол"}'.encode()
+
+    assert FastJSONParser().parse(io.BytesIO(content)) == JSONParser().parse(io.BytesIO(content))
+    for invalid in (b'{"items": ', b'{"price": NaN}'):
+        with pytest.raises(ParseError):
+            FastJSONParser().parse(io.BytesIO(invalid))
+
+
+@pytest.mark.django_db
+def test_catalog_response(client, model_factory):
+    shop = model_factory(Shop, name='Связной')
+
+    response = client.get(reverse('shops-detail', kwargs={'pk': shop.pk}))
+
+    assert response['Content-Type'] == 'application/json'
+    assert response.json()['name'] == 'Связной'
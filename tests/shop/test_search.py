@@ -0,0 +1,36 @@
+import pytest
+from django.urls import reverse
+
+from shop.models import Product
+
+
+def search(client, text):
+    response = client.get(reverse('products-list'), {'search': text})
+    assert response.status_code == 200
+    return [product['name'] for product in response.json()['results']]
+
+
+@pytest.mark.django_db
+def test_search_imported_products(client, importer, price_list):
+    '''Поиск по названию, модели и значениям параметров, документы обновляет импорт'''
+    importer().run(price_list.items())
+
+    assert search(client, 'xs max') == ['Смартфон Apple iPhone XS Max 512GB (золотистый)']
+    assert search(client, 'красн') == ['Смартфон Apple iPhone XR 256GB (красный)']
+    assert len(search(client, 'apple iphone xr')) == 3
+    assert search(client, 'nokia') == []
+
+    price_list['goods'][0]['parameters']['Цвет'] = 'серебристый'
+    importer().run(price_list.items())
+
+    assert search(client, 'серебрист') == ['Смартфон Apple iPhone XS Max 512GB (золотистый)']
+
+
+@pytest.mark.django_db
+def test_search_ranking(client, model_factory, django_capture_on_commit_callbacks):
+    '''Продукты с большим числом совпадений выше в выдаче'''
+    with django_capture_on_commit_callbacks(execute=True):
+        model_factory(Product, name='Чехол для iPhone')
+        model_factory(Product, name='iPhone чехол iPhone кожаный iPhone')
+
+    assert search(client, 'iphone') == ['iPhone чехол iPhone кожаный iPhone', 'Чехол для iPhone']
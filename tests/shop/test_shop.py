@@ -14,7 +14,7 @@ def test_shops_list(client, model_factory):
     shops.sort(key=lambda x: x.name.lower())
     url = reverse('shops-list')
 
-    response = client.get(url)
+    response = client.get(url, {'count': 'true'})
 
     assert response.status_code == HTTP_200_OK
 
@@ -44,7 +44,7 @@ def test_products_filter(client, model_factory):
     model_factory(ProductInfo, shop=shop, product=products[0], price=100, quantity=1)
 
     url = reverse('products-list')
-    response = client.get(url, {'shops__id': shop.id})
+    response = client.get(url, {'shops__id': shop.id, 'count': 'true'})
     response_json = response.json()
 
     assert response.status_code == HTTP_200_OK
@@ -52,11 +52,12 @@ def test_products_filter(client, model_factory):
 
 
 @pytest.mark.django_db
-def test_products_searching(client, model_factory):
-    products = model_factory(Product, _quantity=5)
+def test_products_searching(client, model_factory, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        products = model_factory(Product, _quantity=5)
 
     url = reverse('products-list')
-    response = client.get(url, {'search': products[1].name})
+    response = client.get(url, {'search': products[1].name, 'count': 'true'})
     response_json = response.json()
 
     assert response.status_code == HTTP_200_OK
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from shop.models import Shop, Product, Order, OrderItem, ProductInfo
+from shop.stock import StockReservationError, release_expired_reservations, reserve_stock
+
+
+@pytest.fixture
+def order(get_token, model_factory):
+    order = model_factory(Order, user=get_token.user, status='basket')
+    for quantity in (3, 1):
+        product_info = model_factory(
+            ProductInfo, shop=model_factory(Shop), product=model_factory(Product), price=10, quantity=quantity
+        )
+        model_factory(OrderItem, order=order, product=product_info, quantity=quantity)
+    return order
+
+
+@pytest.mark.django_db
+def test_reserve_stock(order):
+    reserve_stock(order)
+
+    assert order.stock_reserved and Order.objects.get(pk=order.pk).stock_reserved
+    assert list(ProductInfo.objects.values_list('quantity', flat=True)) == [0, 0]
+    with pytest.raises(StockReservationError) as error:
+        reserve_stock(order)
+    assert [failure['available'] for failure in error.value.failures] == [0, 0]
+
+
+@pytest.mark.django_db
+def test_confirm_reports_all_missing_items(buyer_client, order):
+    '''При нехватке остатки не меняются, в ответе все позиции с нехваткой'''
+    items = list(order.ordered_items.select_related('product'))
+    ProductInfo.objects.filter(pk=items[0].product_id).update(quantity=2)
+    Shop.objects.filter(pk=items[1].product.shop_id).update(is_open=False)
+
+    contacts = {'city': 'Москва', 'street': 'Тверская', 'house': '1', 'apartment': '1', 'phone': '+79990000000'}
+
+    response = buyer_client.post(reverse('basket-confirm'), contacts)
+
+    assert response.status_code == 400
+    assert response.json()['items'] == [
+        {'product': items[0].product_id, 'requested': 3, 'available': 2},
+        {'product': items[1].product_id, 'requested': 1, 'available': 0},
+    ]
+    assert list(ProductInfo.objects.order_by('id').values_list('quantity', flat=True)) == [2, 1]
+    order.refresh_from_db()
+    assert (order.status, order.stock_reserved, order.contacts) == ('basket', False, None)
+
+
+@pytest.mark.django_db
+def test_release_expired_reservations(order, model_factory):
+    '''Просроченные новые заказы отменяются пачками, товары возвращаются на склад'''
+    reserve_stock(order)
+    Order.objects.filter(pk=order.pk).update(status='new', updated_at=timezone.now() - timedelta(days=2))
+    fresh = model_factory(Order, user=order.user, status='new', stock_reserved=True)
+    model_factory(OrderItem, order=fresh, product=order.ordered_items.first().product, quantity=1)
+
+    released = release_expired_reservations(ttl=24 * 60 * 60, batch_size=1)
+
+    assert released == {'orders': 1, 'units': 4, 'batches': 1}
+    assert list(ProductInfo.objects.order_by('id').values_list('quantity', flat=True)) == [3, 1]
+    order.refresh_from_db()
+    assert (order.status, order.stock_reserved) == ('canceled', False)
+    assert Order.objects.get(pk=fresh.pk).stock_reserved
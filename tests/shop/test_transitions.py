@@ -0,0 +1,90 @@
+import pytest
+from django.core import mail
+from django.urls import reverse
+
+from shop.models import Shop, Product, Order, OrderItem, ProductInfo
+from shop.tasks import bulk_status_email_task
+from shop.transitions import TransitionError, change_status
+from users.models import User
+
+
+@pytest.fixture
+def shop_client(client, get_token):
+    get_token.user.role = 'shop'
+    get_token.user.save()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + get_token.key)
+    return client
+
+
+def make_order(model_factory, shop, status, quantity=1):
+    order = model_factory(Order, status=status, stock_reserved=True)
+    product_info = model_factory(ProductInfo, shop=shop, product=model_factory(Product), price=10, quantity=0)
+    model_factory(OrderItem, order=order, product=product_info, quantity=quantity)
+    return order
+
+
+@pytest.mark.django_db
+def test_partner_changes_status(shop_client, get_token, model_factory, django_assert_max_num_queries,
+                                django_capture_on_commit_callbacks):
+    '''Меняются только заказы целиком из товаров магазина в текущем статусе, письма - одной задачей'''
+    shop = model_factory(Shop, user=get_token.user)
+    assembled = [make_order(model_factory, shop, 'assembled') for _ in range(5)]
+    sent = make_order(model_factory, shop, 'sent')
+    other_shop = make_order(model_factory, model_factory(Shop), 'assembled')
+    # позиция магазина в заказе с товарами другого магазина
+    mixed = make_order(model_factory, model_factory(Shop), 'assembled')
+    model_factory(OrderItem, order=mixed, product=assembled[0].ordered_items.get().product)
+    order_ids = [order.id for order in (*assembled, sent, other_shop, mixed)]
+
+    with django_capture_on_commit_callbacks() as callbacks, django_assert_max_num_queries(8):
+        response = shop_client.post(reverse('partner-orders-status'), {
+            'orders': order_ids, 'from_status': 'assembled', 'status': 'sent'
+        }, format='json')
+
+    assert response.status_code == 200
+    assert response.json() == {
+        'changed': [order.id for order in assembled], 'skipped': [sent.id, other_shop.id, mixed.id]
+    }
+    assert Order.objects.filter(status='sent').count() == 6
+    assert Order.objects.get(pk=other_shop.pk).status == Order.objects.get(pk=mixed.pk).status == 'assembled'
+    assert len(callbacks) == 1
+
+
+@pytest.mark.django_db
+def test_partner_transitions(shop_client):
+    response = shop_client.post(reverse('partner-orders-status'), {
+        'orders': [1], 'from_status': 'new', 'status': 'canceled'
+    }, format='json')
+
+    assert response.status_code == 400
+    assert 'status' in response.json()
+    with pytest.raises(TransitionError):
+        change_status(Order.objects.all(), 'delivered', 'new')
+
+
+@pytest.mark.django_db
+def test_cancel_releases_stock(model_factory):
+    '''При массовой отмене резерв всех заказов возвращается на склад'''
+    shop = model_factory(Shop)
+    orders = [make_order(model_factory, shop, 'confirmed', quantity) for quantity in (2, 3)]
+    unreserved = model_factory(Order, status='new', stock_reserved=False)
+
+    assert change_status(Order.objects.all(), 'confirmed', 'canceled') == [order.id for order in orders]
+    assert change_status(Order.objects.all(), 'new', 'confirmed') == []
+
+    assert list(ProductInfo.objects.order_by('id').values_list('quantity', flat=True)) == [2, 3]
+    assert not Order.objects.filter(stock_reserved=True).exists()
+    assert Order.objects.get(pk=unreserved.pk).status == 'new'
+
+
+@pytest.mark.django_db
+def test_bulk_status_email(model_factory):
+    '''Покупателям по письму на заказ, администратору одно письмо на всю пачку'''
+    admin = User.objects.create_superuser(email='admin@example.com', username='admin', password='QWERTY!1qwerty')
+    orders = [model_factory(Order, status='sent', user__email=f'buyer{i}@example.com') for i in range(3)]
+
+    bulk_status_email_task([order.id for order in orders], 'sent')
+
+    assert len(mail.outbox) == 4
+    assert mail.outbox[-1].to == [admin.email]
+    assert 'Отправлен' in mail.outbox[0].body